@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""Deterministic synthetic images for the benchmarks."""
+
+import random
+
+from PIL import Image, ImageDraw
+
+SEED = 20121014
+
+
+def _noise(width, height, seed=SEED):
+    rng = random.Random(seed)
+    return Image.frombytes("L", (width, height), rng.randbytes(width * height))
+
+
+def flat_ui(width, height):
+    """Flat colored widgets on a plain background, like a screenshot."""
+    image = Image.new("RGB", (width, height), (246, 246, 246))
+    draw = ImageDraw.Draw(image)
+    rng = random.Random(SEED)
+    colors = [(33, 150, 243), (76, 175, 80), (255, 193, 7), (244, 67, 54),
+              (96, 125, 139), (255, 255, 255)]
+    draw.rectangle((0, 0, width, 28), fill=(38, 50, 56))
+    for _ in range(width * height // 4000):
+        x = rng.randrange(width)
+        y = rng.randrange(32, max(33, height))
+        w = rng.randrange(20, 200)
+        h = rng.randrange(8, 60)
+        draw.rectangle((x, y, x + w, y + h), fill=rng.choice(colors),
+                       outline=(200, 200, 200))
+    return image
+
+
+def plot(width, height):
+    """Line plot on a grid, like a Matplotlib figure."""
+    image = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(image)
+    for i in range(0, width, 40):
+        draw.line((i, 0, i, height), fill=(220, 220, 220))
+    for i in range(6):
+        points = [(x, height / 2 + (i + 1) * 20 * ((x * (i + 3)) % 97 - 48) / 48)
+                  for x in range(0, width, 8)]
+        draw.line(points, fill=(40 * i, 90, 255 - 40 * i), width=2)
+    return image
+
+
+def photo(width, height):
+    """Smooth structure with sensor-like noise, like a photograph."""
+    gradient = Image.linear_gradient("L").resize((width, height))
+    mandel = Image.effect_mandelbrot((width, height), (-2, -1.2, 1, 1.2), 64)
+    noise = _noise(width, height)
+    return Image.merge("RGB", (mandel, gradient, noise))
+
+
+def noise(width, height):
+    """Uncorrelated RGB noise, the worst case for run-length encoding."""
+    return Image.merge("RGB", [_noise(width, height, SEED + i) for i in range(3)])
+
+
+def gradient(width, height):
+    """Horizontal and vertical gradients."""
+    horizontal = Image.linear_gradient("L").rotate(90).resize((width, height))
+    vertical = Image.linear_gradient("L").resize((width, height))
+    return Image.merge("RGB", (horizontal, vertical, horizontal.point(lambda v: 255 - v)))
+
+
+def alpha(width, height):
+    """Icon-like RGBA image where most pixels are transparent."""
+    image = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(image)
+    rng = random.Random(SEED)
+    for _ in range(max(1, width * height // 20000)):
+        x = rng.randrange(width)
+        y = rng.randrange(height)
+        r = rng.randrange(8, 64)
+        color = (rng.randrange(256), rng.randrange(256), rng.randrange(256),
+                 rng.choice((128, 255)))
+        draw.ellipse((x - r, y - r, x + r, y + r), fill=color)
+    return image
+
+
+IMAGES = {
+    "flat_ui": flat_ui,
+    "plot": plot,
+    "photo": photo,
+    "noise": noise,
+    "gradient": gradient,
+    "alpha": alpha,
+}
+
+# name: (image class, width, height)
+CASES = {
+    "flat_ui": ("flat_ui", 1280, 720),
+    "plot": ("plot", 800, 600),
+    "photo": ("photo", 1280, 720),
+    "noise": ("noise", 640, 480),
+    "gradient": ("gradient", 1280, 720),
+    "alpha": ("alpha", 512, 512),
+    "tall": ("photo", 64, 4000),
+    "wide": ("photo", 4000, 64),
+}
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""Compares output size and encode time of the sixel encoder modes."""
+
+import argparse
+import time
+from io import BytesIO
+
+import images
+from sixel.converter import SixelConverter
+
+
+MODES = {
+    "fast": dict(fast=True),
+    "packed": dict(fast=True, packed=True),
+    "size": dict(fast=False),
+}
+
+
+IMAGES = {
+    "plot": images.plot,
+    "photo": images.photo,
+}
+
+
+def encode(image, mode, ncolor):
+    buffer = BytesIO()
+    image.save(buffer, format="png")
+    converter = SixelConverter(buffer, ncolor=ncolor, **MODES[mode])
+    start = time.perf_counter()
+    value = converter.getvalue()
+    return time.perf_counter() - start, len(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="sixel encoder mode benchmark")
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--ncolor", type=int, default=256)
+    args = parser.parse_args()
+
+    print("%-8s %-8s %12s %10s" % ("image", "mode", "bytes/frame", "encode s"))
+    for name, factory in IMAGES.items():
+        image = factory(args.width, args.height)
+        for mode in MODES:
+            seconds, size = encode(image, mode, args.ncolor)
+            print("%-8s %-8s %12d %10.3f" % (name, mode, size, seconds))
+
+
+if __name__ == "__main__":
+    main()
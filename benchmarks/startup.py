@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""Checks the startup time of the package and sixelconv against a budget.
+
+Run it from the repository root, it exits with 1 when a budget is exceeded
+or a command imports a module it should not:
+
+    PYTHONPATH=. python benchmarks/startup.py
+"""
+
+import argparse
+import ast
+import os
+import subprocess
+import sys
+import time
+
+# Commands, milliseconds they may add to a bare interpreter start, and
+# modules they must not import
+CASES = {
+    "import": ("import sixel", 15, ("PIL", "numpy", "termios", "optparse")),
+    "version": ("import sys; sys.argv[1:] = ['--version']; import sixel; sixel.main()",
+                30, ("PIL", "numpy", "termios", "logging")),
+}
+
+# Reports the forbidden modules at exit, as sixelconv --version exits early
+_CHECK = ("import atexit, sys\n"
+          "atexit.register(lambda: sys.stderr.write("
+          "repr(sorted(m for m in %r if m in sys.modules))))\n")
+
+
+def _run(code, env):
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", code], env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                            check=True)
+    return time.perf_counter() - start, result.stderr.decode()
+
+
+def best(code, env, repeat):
+    return min(_run(code, env)[0] for _ in range(repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="sixel startup benchmark")
+    parser.add_argument("--repeat", type=int, default=20,
+                        help="Runs per command, the fastest is kept")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="Factor applied to the budgets on slow machines")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.pop("PYTHONSTARTUP", None)
+    baseline = best("pass", env, args.repeat)
+    failed = 0
+    print("%-8s %10s %10s %s" % ("case", "added ms", "budget ms", "loaded"))
+    for name, (code, budget, forbidden) in CASES.items():
+        added = (best(code, env, args.repeat) - baseline) * 1000
+        loaded = ast.literal_eval(_run(_CHECK % (forbidden,) + code, env)[1] or "[]")
+        over = added > budget * args.scale
+        failed += over or bool(loaded)
+        print("%-8s %10.1f %10.1f %s%s" % (name, added, budget * args.scale,
+                                            ", ".join(loaded) or "-",
+                                            "  OVER BUDGET" if over else ""))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""Reproducible benchmark of every encoder mode over synthetic images.
+
+Run it from the repository root, results are written as JSON:
+
+    PYTHONPATH=. python benchmarks/suite.py -o base.json
+    PYTHONPATH=. python benchmarks/suite.py -o head.json
+    PYTHONPATH=. python benchmarks/suite.py --compare base.json head.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from io import BytesIO
+
+import PIL
+from PIL import Image
+
+import images
+import sixel
+from sixel.converter import SixelConverter
+from sixel.encoder import numpy
+from sixel.stats import SixelStats
+
+MODES = {
+    "fast": dict(fast=True),
+    "packed": dict(fast=True, packed=True),
+    "size": dict(fast=False),
+    "alpha": dict(alpha_threshold=128),
+    "octree": dict(fast=True, packed=True, quantizer="octree"),
+    "kmeans": dict(fast=True, packed=True, quantizer="kmeans"),
+    "optimize": dict(optimize=3),
+}
+
+NCOLORS = (16, 64, 256)
+
+# Relative change reported as a regression by --compare
+THRESHOLD = 0.10
+
+
+def _rss_kib(field):
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _reset_peak_rss():
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    cpu = time.process_time()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start, time.process_time() - cpu
+
+
+def run_case(png, mode, ncolor, repeat):
+    """Measures one image, mode and color count; runs in a child process."""
+    best = None
+    for _ in range(repeat):
+        _, decode, _ = _timed(lambda: Image.open(BytesIO(png)).convert("RGBA"))
+
+        rss_reset = _reset_peak_rss()
+        rss_base = _rss_kib("VmRSS")
+        tracemalloc.start()
+        stats = SixelStats()
+        converter, init, _ = _timed(SixelConverter, BytesIO(png), ncolor=ncolor,
+                                    stats=stats, **MODES[mode])
+        value, encode, encode_cpu = _timed(converter.tobytes)
+        traced_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        rss_peak = _rss_kib("VmHWM")
+        stages = stats.as_dict()["stages"]
+
+        result = {
+            "decode_s": decode,
+            # As the converter quantizes, after resizing with the mode's
+            # quantizer
+            "quantize_s": stages["quantize"]["wall_s"],
+            "init_s": init,
+            "encode_s": encode,
+            "encode_cpu_s": encode_cpu,
+            "total_s": init + encode,
+            "traced_peak_bytes": traced_peak,
+            "rss_peak_kib": rss_peak - rss_base if rss_reset and rss_peak else None,
+            "output_bytes": len(value),
+            "stages": stages,
+            "counters": stats.counters,
+        }
+        if best is None or result["total_s"] < best["total_s"]:
+            best = result
+        del converter, value
+    return best
+
+
+def _run_isolated(png, mode, ncolor, repeat):
+    # A fresh process per case keeps peak memory readings independent
+    context = multiprocessing.get_context("fork" if hasattr(os, "fork") else "spawn")
+    with context.Pool(1) as pool:
+        return pool.apply(run_case, (png, mode, ncolor, repeat))
+
+
+def environment():
+    return {
+        "sixel": sixel.__version__,
+        "python": platform.python_version(),
+        "pillow": PIL.__version__,
+        "numpy": numpy.__version__ if numpy is not None else None,
+        "machine": platform.machine(),
+        "system": platform.system(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def run(cases, modes, ncolors, repeat, scale, progress):
+    results = []
+    for case in cases:
+        kind, width, height = images.CASES[case]
+        width = max(1, int(width * scale))
+        height = max(1, int(height * scale))
+        image = images.IMAGES[kind](width, height)
+        buffer = BytesIO()
+        image.save(buffer, format="png")
+        png = buffer.getvalue()
+        for mode in modes:
+            for ncolor in ncolors:
+                measured = _run_isolated(png, mode, ncolor, repeat)
+                measured.update(case=case, image=kind, width=width,
+                                height=height, mode=mode, ncolor=ncolor)
+                results.append(measured)
+                if progress:
+                    print("%-9s %-7s %4d %9.3fs %10d bytes" % (
+                        case, mode, ncolor, measured["total_s"],
+                        measured["output_bytes"]), file=sys.stderr)
+    return {"environment": environment(), "results": results}
+
+
+def compare(base, head, threshold):
+    """Prints per case changes and returns the number of regressions."""
+    def key(result):
+        return result["case"], result["mode"], result["ncolor"]
+
+    base_results = {key(r): r for r in base["results"]}
+    regressions = 0
+    print("%-9s %-7s %4s %10s %10s %12s %12s" % (
+        "case", "mode", "ncol", "base s", "head s", "base bytes", "head bytes"))
+    for result in head["results"]:
+        old = base_results.get(key(result))
+        if old is None:
+            continue
+        flags = []
+        if result["total_s"] > old["total_s"] * (1 + threshold):
+            flags.append("slower")
+        if result["output_bytes"] > old["output_bytes"] * (1 + threshold):
+            flags.append("bigger")
+        regressions += len(flags)
+        print("%-9s %-7s %4d %10.3f %10.3f %12d %12d %s" % (
+            result["case"], result["mode"], result["ncolor"], old["total_s"],
+            result["total_s"], old["output_bytes"], result["output_bytes"],
+            " ".join(flags)))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="sixel benchmark suite")
+    parser.add_argument("-o", "--output", help="JSON file, stdout by default")
+    parser.add_argument("--case", action="append", choices=sorted(images.CASES),
+                        help="Image case to run, all by default")
+    parser.add_argument("--mode", action="append", choices=sorted(MODES),
+                        help="Encoder mode to run, all by default")
+    parser.add_argument("--ncolor", action="append", type=int,
+                        help="Palette size to run, %s by default" % (NCOLORS,))
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Runs per case, the fastest is kept")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="Scale factor for the image sizes")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "HEAD"),
+                        help="Compare two result files instead of running")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD,
+                        help="Relative change reported as regression")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            base = json.load(f)
+        with open(args.compare[1]) as f:
+            head = json.load(f)
+        sys.exit(1 if compare(base, head, args.threshold) else 0)
+
+    report = run(args.case or list(images.CASES), args.mode or list(MODES),
+                 args.ncolor or NCOLORS, args.repeat, args.scale,
+                 progress=args.output is not None)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=1)
+    else:
+        json.dump(report, sys.stdout, indent=1)
+        print()
+
+
+if __name__ == "__main__":
+    main()
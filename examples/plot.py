@@ -4,7 +4,6 @@
 # Copyright 2023 Lubosz Sarnecki <lubosz@gmail.com>
 # SPDX-License-Identifier: GPL-3.0-or-later
 
-from io import BytesIO
 import matplotlib
 import matplotlib.pyplot as plt
 import numpy
@@ -12,11 +11,9 @@ import sixel
 
 
 def sixel_fig():
-    buffer = BytesIO()
-    plt.savefig(buffer, format='png')
-
+    # The Agg canvas is read in place, without a PNG round-trip
     writer = sixel.SixelWriter()
-    writer.draw(buffer)
+    writer.draw(plt.gcf())
 
 
 def main():
@@ -30,4 +27,3 @@ def main():
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+# Copyright 2012-2014 Hayaki Saito <user@zuse.jp>
+# Copyright 2023 Lubosz Sarnecki <lubosz@gmail.com>
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# Windows fixed fork by Simon Kalmi Claesson @sbamboo
+
+import asyncio
+from functools import partial
+
+from .converter import SixelConverter
+from .output import ENCODING
+
+# Sixel bands encoded per executor call
+DEFAULT_BANDS = 4
+# Seconds between write buffer checks on transports without drain()
+TRANSPORT_POLL_INTERVAL = 0.01
+
+
+async def drain(output):
+    """Waits until an asyncio stream writer or transport can take more data."""
+    if hasattr(output, "drain"):
+        await output.drain()
+        return
+    high = output.get_write_buffer_limits()[1]
+    while output.get_write_buffer_size() > high and not output.is_closing():
+        await asyncio.sleep(TRANSPORT_POLL_INTERVAL)
+
+
+class AsyncSixelConverter:
+    """Runs a :class:`SixelConverter` without blocking the event loop.
+
+    Decoding, quantization and encoding run in ``executor`` (the loop's
+    default executor if None), which has to be thread based since encoding
+    continues on the same converter between calls.
+    """
+
+    def __init__(self, converter, executor=None):
+        self.converter = converter
+        self._executor = executor
+
+    @classmethod
+    async def create(cls, file, *args, executor=None, **kwargs):
+        """Opens and quantizes an image in the executor."""
+        loop = asyncio.get_running_loop()
+        converter = await loop.run_in_executor(
+            executor, partial(SixelConverter, file, *args, **kwargs))
+        return cls(converter, executor)
+
+    async def write(self, output, body_only=False, bands=DEFAULT_BANDS):
+        """Encodes to an asyncio stream writer or transport.
+
+        Every chunk of ``bands`` sixel bands is written as soon as it is
+        encoded, waiting for the writer to drain in between.  If the task
+        is cancelled after the header went out, the string terminator is
+        still written so the terminal does not stay in the sixel DCS.
+        """
+        loop = asyncio.get_running_loop()
+        chunks = self.converter.iter_encode(body_only, bands)
+        st = self.converter.ST.encode(ENCODING)
+        opened = False
+        try:
+            while True:
+                chunk = await loop.run_in_executor(self._executor, next,
+                                                   chunks, None)
+                if chunk is None:
+                    break
+                output.write(chunk)
+                opened = not body_only and not chunk.endswith(st)
+                await drain(output)
+        finally:
+            if opened:
+                output.write(st)
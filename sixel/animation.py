@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+# Copyright 2012-2014 Hayaki Saito <user@zuse.jp>
+# Copyright 2023 Lubosz Sarnecki <lubosz@gmail.com>
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# Windows fixed fork by Simon Kalmi Claesson @sbamboo
+
+import time
+
+from PIL import Image, ImageSequence
+
+from .converter import _open_image
+from .encoder import numpy, encode_packed_band, encode_packed_band_python
+from .frames import encode_bands
+from .output import stdout, write_bytes
+from .registers import PRIVATE_REGISTERS
+from .sixel import SixelWriter
+
+# Frames sampled to build the shared palette
+PALETTE_SAMPLE_FRAMES = 16
+# Longest side of each sampled frame
+PALETTE_SAMPLE_SIZE = 128
+# Frame duration in milliseconds when the source does not specify one
+DEFAULT_DURATION = 100
+
+
+class SixelAnimation:
+    """Plays an animated image or a sequence of images as sixels.
+
+    ``file`` is an animated GIF/APNG (or any image Pillow can iterate) or a
+    list of image files.  All frames share one palette, and only the 6-row
+    bands that changed since the previously shown frame are re-sent.
+    Frames larger than ``max_size`` are scaled down to fit.
+    """
+
+    def __init__(self, file,
+                 f8bit=False,
+                 w=None,
+                 h=None,
+                 ncolor=256,
+                 duration=DEFAULT_DURATION,
+                 cell_height=None,
+                 max_size=None):
+
+        if ncolor >= 256:
+            ncolor = 256
+
+        self._ncolor = ncolor
+        self._size = (w, h)
+        self._max_size = max_size
+        self._duration = duration
+        self._cell_height = cell_height
+
+        if f8bit:  # 8bit mode
+            self.DCS = '\x90'
+            self.ST = '\x9c'
+        else:
+            self.DCS = '\x1bP'
+            self.ST = '\x1b\\'
+
+        if isinstance(file, (list, tuple)):
+            self._files = list(file)
+            self._image = None
+        else:
+            self._files = None
+            self._image = Image.open(file)
+
+        self._palette_image = self.__build_palette()
+        self.palette = self._palette_image.getpalette()
+        self.dropped = 0
+
+    def __iter_images(self):
+        if self._files is None:
+            for frame in ImageSequence.Iterator(self._image):
+                yield frame, frame.info.get("duration") or self._duration
+        else:
+            for file in self._files:
+                with Image.open(file) as image:
+                    yield image, self._duration
+
+    def __resize(self, image):
+        w, h = self._size
+        return _open_image(image, "RGB", w, h, max_size=self._max_size)
+
+    def __build_palette(self):
+        if self._files is None:
+            count = getattr(self._image, "n_frames", 1)
+            step = max(1, count // PALETTE_SAMPLE_FRAMES)
+            samples = []
+            for i in range(0, count, step):
+                self._image.seek(i)
+                samples.append(self._image.convert("RGB"))
+            self._image.seek(0)
+        else:
+            step = max(1, len(self._files) // PALETTE_SAMPLE_FRAMES)
+            samples = []
+            for file in self._files[::step]:
+                with Image.open(file) as image:
+                    samples.append(image.convert("RGB"))
+
+        for sample in samples:
+            sample.thumbnail((PALETTE_SAMPLE_SIZE, PALETTE_SAMPLE_SIZE))
+        sheet = Image.new("RGB", (sum(s.width for s in samples),
+                                  max(s.height for s in samples)))
+        x = 0
+        for sample in samples:
+            sheet.paste(sample, (x, 0))
+            x += sample.width
+        return sheet.convert("P", palette=Image.Palette.ADAPTIVE,
+                             colors=self._ncolor)
+
+    def __quantize(self, image):
+        image = self.__resize(image).quantize(palette=self._palette_image,
+                                              dither=Image.Dither.NONE)
+        return image.tobytes(), image.size
+
+    def __encode_band(self, data, width, y, band):
+        if numpy is not None:
+            pixels = numpy.frombuffer(data, numpy.uint8)
+            pixels = pixels[y * width:(y + band) * width].reshape(band, width)
+            return encode_packed_band(pixels)
+        return encode_packed_band_python(data, width, y, band)
+
+    def encode_frame(self, data, size, previous=None, registers=None):
+        """Encodes a quantized frame as a sixel.
+
+        Returns the number of pixel rows skipped from the top of the image
+        and the sixel.  Only bands that differ from ``previous`` are sent;
+        ``None`` is returned instead of a sixel when nothing changed.
+        Colors ``registers`` already hold are not defined again.
+        """
+        if registers is None:
+            registers = PRIVATE_REGISTERS
+        width, height = size
+        stride = width * 6
+        bands = range(0, height, 6)
+        if previous is None:
+            changed = list(bands)
+        else:
+            changed = [y for y in bands
+                       if data[y * width:y * width + stride]
+                       != previous[y * width:y * width + stride]]
+        if not changed:
+            return 0, None
+
+        def encode_band(y, band):
+            return self.__encode_band(data, width, y, band)
+
+        cell_height = self._cell_height if previous is not None else None
+        return encode_bands(changed, width, height, encode_band, self.palette,
+                            registers, self.DCS, self.ST, cell_height)
+
+    def iter_frames(self):
+        """Yields (skipped rows, sixel or None, duration in seconds)."""
+        previous = None
+        for image, duration in self.__iter_images():
+            data, size = self.__quantize(image)
+            top, sixel = self.encode_frame(data, size, previous)
+            previous = data
+            yield top, sixel, duration / 1000
+
+    def play(self, output=None, writer=None, loop=1, drop_frames=True):
+        """Plays the animation ``loop`` times, forever if ``loop`` is 0.
+
+        Frames are shown for their duration.  With ``drop_frames``, frames
+        whose display time has already passed when they are due are
+        skipped instead of delaying the rest of the animation.
+        """
+        if output is None:
+            output = stdout()
+        if writer is None:
+            writer = SixelWriter()
+
+        played = 0
+        previous = None
+        while loop == 0 or played < loop:
+            played += 1
+            due = time.monotonic()
+            for image, duration in self.__iter_images():
+                start = due
+                due += duration / 1000
+                if drop_frames and previous is not None \
+                        and time.monotonic() > due:
+                    self.dropped += 1
+                    continue
+                data, size = self.__quantize(image)
+                top, sixel = self.encode_frame(data, size, previous,
+                                               writer.registers)
+                previous = data
+                delay = start - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                if sixel is None:
+                    continue
+                writer.save_position(output)
+                try:
+                    if top:
+                        writer.move_y(top // self._cell_height, False, output)
+                    write_bytes(output, sixel)
+                except BaseException:
+                    writer.abort(output)
+                    raise
+                writer.restore_position(output)
+                output.flush()
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
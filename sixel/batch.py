@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+# Copyright 2012-2014 Hayaki Saito <user@zuse.jp>
+# Copyright 2023 Lubosz Sarnecki <lubosz@gmail.com>
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# Windows fixed fork by Simon Kalmi Claesson @sbamboo
+
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import suppress
+
+from .converter import SixelConverter
+
+SUFFIX = ".six"
+# Files queued per worker, so huge batches are not submitted all at once
+QUEUE_PER_WORKER = 4
+
+
+class BatchResult:
+    """Outcome of converting one file.
+
+    ``error`` is None on success, ``skipped`` is True when the output was
+    already up to date.
+    """
+
+    def __init__(self, path, output, size=0, skipped=False, error=None):
+        self.path = path
+        self.output = output
+        self.size = size
+        self.skipped = skipped
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        return "BatchResult(%r, %r, size=%d, skipped=%r, error=%r)" % (
+            self.path, self.output, self.size, self.skipped, self.error)
+
+
+def output_path(path, output_dir):
+    """Returns the sixel file written for an image in ``output_dir``."""
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(output_dir, name + SUFFIX)
+
+
+def is_up_to_date(path, output):
+    """Returns True if ``output`` exists and is not older than ``path``."""
+    try:
+        return os.stat(output).st_mtime >= os.stat(path).st_mtime
+    except OSError:
+        return False
+
+
+def convert_file(path, output, body_only=False, **options):
+    """Converts one image file to a sixel file, replacing it atomically.
+
+    ``options`` are passed to :class:`SixelConverter`.  Returns a
+    :class:`BatchResult`, errors are reported in it instead of raised.
+    """
+    try:
+        value = SixelConverter(path, **options).tobytes(body_only=body_only)
+        # Each file is converted by one process, the pid keeps it unique
+        tmp = "%s.%d.tmp" % (output, os.getpid())
+        try:
+            with open(tmp, "wb") as f:
+                f.write(value)
+            os.replace(tmp, output)
+        except BaseException:
+            with suppress(OSError):
+                os.unlink(tmp)
+            raise
+    except Exception as e:
+        return BatchResult(path, output, error="%s: %s" % (type(e).__name__, e))
+    return BatchResult(path, output, size=len(value))
+
+
+def _convert_alone(path, output, **options):
+    """Converts one file in a process of its own, reporting if it dies."""
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        try:
+            return executor.submit(convert_file, path, output, **options).result()
+        except BrokenProcessPool as e:
+            return BatchResult(path, output, error="%s: %s" % (type(e).__name__, e))
+
+
+def convert_many(paths, output_dir, jobs=None, force=False, **options):
+    """Converts image files to sixel files in ``output_dir``.
+
+    Files are converted in a pool of ``jobs`` processes (one per CPU if
+    None, in this process if 1) and a :class:`BatchResult` is yielded for
+    each as soon as it is done, so results do not come in input order.
+    Outputs not older than their input are skipped unless ``force``.  A
+    failing file is reported and the batch goes on, also when a worker
+    process dies: the files of the broken pool are converted again one at
+    a time in a process of their own, and the rest go to a new pool.  ``options`` are
+    passed to :class:`SixelConverter`, plus ``body_only``.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+
+    def tasks():
+        seen = {}
+        for path in paths:
+            output = output_path(path, output_dir)
+            if output in seen:
+                if seen[output] == path:
+                    continue
+                yield BatchResult(path, output,
+                                  error="same output as %s" % seen[output])
+                continue
+            seen[output] = path
+            if not force and is_up_to_date(path, output):
+                yield BatchResult(path, output, skipped=True)
+                continue
+            yield path, output
+
+    if jobs <= 1:
+        for task in tasks():
+            if isinstance(task, BatchResult):
+                yield task
+            else:
+                yield convert_file(*task, **options)
+        return
+
+    executor = ProcessPoolExecutor(max_workers=jobs)
+    # Tasks by future, to convert the files of a pool that broke again
+    pending = {}
+    broken = []
+
+    def submit(task):
+        nonlocal executor
+        try:
+            future = executor.submit(convert_file, *task, **options)
+        except BrokenProcessPool:
+            executor.shutdown(wait=False)
+            executor = ProcessPoolExecutor(max_workers=jobs)
+            future = executor.submit(convert_file, *task, **options)
+        pending[future] = task
+
+    def collect():
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            task = pending.pop(future)
+            try:
+                yield future.result()
+            except BrokenProcessPool:
+                broken.append(task)
+
+    try:
+        for task in tasks():
+            if isinstance(task, BatchResult):
+                yield task
+                continue
+            submit(task)
+            if len(pending) >= jobs * QUEUE_PER_WORKER:
+                yield from collect()
+        while pending:
+            yield from collect()
+        for task in broken:
+            yield _convert_alone(*task, **options)
+    finally:
+        executor.shutdown(cancel_futures=True)
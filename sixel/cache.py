@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+# Copyright 2012-2014 Hayaki Saito <user@zuse.jp>
+# Copyright 2023 Lubosz Sarnecki <lubosz@gmail.com>
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# Windows fixed fork by Simon Kalmi Claesson @sbamboo
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from .__about__ import __version__
+from .rc import get_rcdir
+
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+SUFFIX = ".six"
+
+
+def default_cache_dir():
+    """Returns the cache directory inside the rc directory."""
+    return os.path.join(get_rcdir(), "cache")
+
+
+def cache_key(data, **params):
+    """Returns the cache key of encoded image bytes and output parameters.
+
+    Every parameter that changes the encoded output has to be passed, the
+    package version is always part of the key.
+    """
+    digest = hashlib.sha256()
+    digest.update(data)
+    options = ";".join("%s=%r" % item for item in sorted(params.items()))
+    digest.update(("\0%s\0%s" % (__version__, options)).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class SixelCache:
+    """Content-addressed on-disk cache of encoded sixel output.
+
+    Entries are written atomically.  Reading an entry marks it as recently
+    used; the least recently used entries are evicted once the cache grows
+    beyond ``max_size`` bytes.
+    """
+
+    def __init__(self, directory=None, max_size=DEFAULT_MAX_SIZE):
+        if directory is None:
+            directory = default_cache_dir()
+        self.directory = directory
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+    def __path(self, key):
+        return os.path.join(self.directory, key + SUFFIX)
+
+    def get(self, key):
+        """Returns the cached output for a key, or None."""
+        path = self.__path(key)
+        try:
+            with open(path, "rb") as f:
+                value = f.read()
+        except OSError:
+            self.misses += 1
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """Stores the output for a key and evicts old entries."""
+        os.makedirs(self.directory, exist_ok=True)
+        import tempfile  # only needed on a miss, slow to import
+
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(value)
+            os.replace(tmp, self.__path(key))
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+        self.evict()
+
+    def evict(self):
+        """Removes least recently used entries until the cache fits."""
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.name.endswith(SUFFIX):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
+
+
+class MemoryCache:
+    """In-memory LRU cache of encoded sixel output, safe to share by threads.
+
+    Same interface as :class:`SixelCache`, for long-running processes.
+    """
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE):
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the cached output for a key, or None."""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Stores the output of a key, evicting least recently used ones."""
+        if len(value) > self.max_size:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._entries[key] = value
+            self.size += len(value)
+            while self.size > self.max_size:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
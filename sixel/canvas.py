@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+# Copyright 2012-2014 Hayaki Saito <user@zuse.jp>
+# Copyright 2023 Lubosz Sarnecki <lubosz@gmail.com>
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# Windows fixed fork by Simon Kalmi Claesson @sbamboo
+
+from PIL import ImageChops
+
+from .converter import DEFAULT_RESAMPLE, TRANSPARENT, _open_image
+from .encoder import numpy, encode_packed_band, encode_packed_band_python
+from .frames import encode_bands
+from .output import stdout, write_bytes
+from .quantize import DEFAULT_QUANTIZER, quantize, remap
+from .sixel import SixelWriter
+
+# Width in pixels of the tiles frames are compared in
+TILE_WIDTH = 64
+# Fraction of changed tiles from which the whole image is sent again
+FULL_REFRESH = 0.5
+# Channel error beyond which a pixel counts as mapped to a wrong color
+REMAP_TOLERANCE = 32
+# Fraction of pixels newly mapped to wrong colors from which the palette is
+# chosen again
+MAX_DRIFT = 0.001
+
+
+class SixelCanvas:
+    """Redraws a changing image in place, sending only what changed.
+
+    Every frame is compared with the previous one in tiles of one sixel
+    band (6 rows) by ``tile_width`` pixels.  Only changed tiles are sent;
+    unchanged bands cost one byte and unchanged tiles within a band are
+    skipped with blank sixels.  Once more than ``full_refresh`` of the
+    tiles changed, the whole image is sent with a new palette.  Frames
+    between full refreshes are mapped to the palette of the last one; once
+    more than ``max_drift`` of the pixels have colors that palette lacks,
+    the whole image is sent with a new palette as well.
+
+    With ``cell_height``, the pixel height of a terminal cell, the cursor
+    is moved down over unchanged cell rows instead of sending blank bands.
+    ``quantizer`` and ``dither`` are passed to :func:`sixel.quantize.quantize`;
+    with a fixed palette such as xterm256 no palette is chosen per frame.
+    Frames are opened and scaled like :class:`SixelConverter` does, with
+    ``w``, ``h``, ``fit``, ``resample`` and ``max_size``; the capabilities
+    of ``writer`` cap the colors and size like in :meth:`SixelWriter.draw`.
+    """
+
+    def __init__(self,
+                 f8bit=False,
+                 w=None,
+                 h=None,
+                 ncolor=256,
+                 cell_height=None,
+                 tile_width=TILE_WIDTH,
+                 full_refresh=FULL_REFRESH,
+                 max_drift=MAX_DRIFT,
+                 writer=None,
+                 quantizer=DEFAULT_QUANTIZER,
+                 dither=None,
+                 resample=DEFAULT_RESAMPLE,
+                 fit=False,
+                 max_size=None):
+
+        self._writer = writer if writer is not None else SixelWriter(f8bit)
+        ncolor, max_size = self._writer.capped(ncolor, max_size)
+        if ncolor >= 256:
+            ncolor = 256
+
+        self._ncolor = ncolor
+        self._size = (w, h)
+        self._fit = fit
+        self._resample = resample
+        self._max_size = max_size
+        self._cell_height = cell_height
+        self._tile_width = tile_width
+        self._full_refresh = full_refresh
+        self._max_drift = max_drift
+        self._misses = 0
+        self._quantizer = quantizer
+        self._dither = dither
+        self._previous = None
+        self._size_drawn = None
+        self._palette_image = None
+        self.palette = None
+        self.full_refreshes = 0
+
+        if f8bit:  # 8bit mode
+            self.DCS = '\x90'
+            self.ST = '\x9c'
+        else:
+            self.DCS = '\x1bP'
+            self.ST = '\x1b\\'
+
+    def invalidate(self):
+        """Makes the next frame a full refresh, e.g. after the screen cleared."""
+        self._previous = None
+
+    def __load(self, image):
+        w, h = self._size
+        return _open_image(image, "RGB", w, h, self._fit, self._max_size,
+                           self._resample)
+
+    def __count_misses(self, frame, quantized):
+        """Returns the number of pixels mapped far from their color."""
+        diff = ImageChops.difference(frame, quantized.convert("RGB"))
+        r, g, b = diff.split()
+        diff = ImageChops.lighter(ImageChops.lighter(r, g), b)
+        return sum(diff.histogram()[REMAP_TOLERANCE + 1:])
+
+    def __changed_tiles(self, frame):
+        """Returns a list of changed tile flags per band."""
+        width, height = frame.size
+        tile = self._tile_width
+        if numpy is not None:
+            diff = (numpy.asarray(frame) != self._previous).any(axis=2)
+            diff = numpy.logical_or.reduceat(diff, numpy.arange(0, height, 6),
+                                             axis=0)
+            diff = numpy.logical_or.reduceat(diff, numpy.arange(0, width, tile),
+                                             axis=1)
+            return diff.tolist()
+        data = frame.tobytes()
+        previous = self._previous
+        stride = width * 3
+        changed = []
+        for y in range(0, height, 6):
+            flags = []
+            for x in range(0, width, tile):
+                start = y * stride + x * 3
+                end = start + min(tile, width - x) * 3
+                flags.append(any(data[p + start:p + end] != previous[p + start:p + end]
+                                 for p in range(0, min(6, height - y) * stride, stride)))
+            changed.append(flags)
+        return changed
+
+    def __encode_band(self, indices, width, y, band, flags):
+        tile = self._tile_width
+        if numpy is not None:
+            pixels = indices[y:y + band]
+            if not all(flags):
+                pixels = pixels.astype(numpy.uint16)
+                columns = numpy.repeat(numpy.array(flags, bool), tile)[:width]
+                pixels[:, ~columns] = TRANSPARENT
+            return encode_packed_band(pixels, TRANSPARENT)
+        data = list(indices[y * width:(y + band) * width])
+        for i, changed in enumerate(flags):
+            if not changed:
+                for row in range(band):
+                    start = row * width + i * tile
+                    end = row * width + min(width, (i + 1) * tile)
+                    data[start:end] = [TRANSPARENT] * (end - start)
+        return encode_packed_band_python(data, width, 0, band, TRANSPARENT)
+
+    def encode(self, image):
+        """Encodes the changes of a frame as a sixel.
+
+        Returns the number of pixel rows skipped from the top of the canvas
+        and the sixel, or None instead of the sixel if nothing changed.
+        """
+        frame = self.__load(image)
+        width, height = frame.size
+        full = self._previous is None or self._size_drawn != frame.size
+        if not full:
+            changed = self.__changed_tiles(frame)
+            count = sum(map(sum, changed))
+            if not count:
+                return 0, None
+            full = count > self._full_refresh * len(changed) * len(changed[0])
+
+        if not full:
+            quantized = remap(frame, self._palette_image, self._dither)
+            # Colors that appeared since the palette was chosen would stay
+            # wrong until enough tiles change
+            misses = self.__count_misses(frame, quantized)
+            full = misses - self._misses > self._max_drift * width * height
+
+        if full:
+            self.full_refreshes += 1
+            quantized = quantize(frame, self._ncolor, self._quantizer,
+                                 self._dither)
+            self._palette_image = quantized
+            self.palette = quantized.getpalette()
+            self._misses = self.__count_misses(frame, quantized)
+            tiles = -(-width // self._tile_width)
+            changed = [[True] * tiles for _ in range(0, height, 6)]
+
+        if numpy is not None:
+            self._previous = numpy.asarray(frame)
+            indices = numpy.asarray(quantized)
+        else:
+            self._previous = frame.tobytes()
+            indices = quantized.tobytes()
+        self._size_drawn = frame.size
+
+        def encode_band(y, band):
+            return self.__encode_band(indices, width, y, band, changed[y // 6])
+
+        bands = [i * 6 for i, flags in enumerate(changed) if any(flags)]
+        cell_height = None if full else self._cell_height
+        return encode_bands(bands, width, height, encode_band, self.palette,
+                            self._writer.registers, self.DCS, self.ST,
+                            cell_height)
+
+    def draw(self, image, output=None):
+        """Draws a frame at the cursor position, which is kept.
+
+        ``image`` is anything :class:`SixelConverter` takes.  Returns the
+        number of bytes sent.
+        """
+        if output is None:
+            output = stdout()
+        top, sixel = self.encode(image)
+        if sixel is None:
+            return 0
+        writer = self._writer
+        writer.save_position(output)
+        try:
+            if top:
+                writer.move_y(top // self._cell_height, False, output)
+            write_bytes(output, sixel)
+        except BaseException:
+            # The terminal may not show the frame encode() compared against
+            self._previous = None
+            writer.abort(output)
+            raise
+        writer.restore_position(output)
+        output.flush()
+        return len(sixel)
@@ -6,14 +6,47 @@
 # Windows fixed fork by Simon Kalmi Claesson @sbamboo
 
 import os
+import re
 import sys
+import json
+import time
+import struct
 import platform
 
+from .rc import get_rcdir
+
 if platform.system() == "Windows":
     import ctypes
 else:
     import termios
     import select
+    import fcntl
+
+# Longest time to wait for the terminal to answer a query
+QUERY_TIMEOUT = 0.5
+# Shortest time to wait for a terminal that answered before
+MIN_QUERY_TIMEOUT = 0.05
+# The wait is this many times the previously measured round-trip
+TIMEOUT_FACTOR = 4
+# Longest time to wait for late answers after a timeout, so they do not
+# reach the shell once raw mode is left
+DRAIN_TIMEOUT = 0.2
+# Terminals remembered in the rc directory, the oldest are dropped first
+MAX_CACHE_ENTRIES = 64
+
+CACHE_FILE = "cellsize.json"
+
+_REPORT = re.compile(r"\x1b\[(\??)([0-9;]*)(\$?[A-Za-z])")
+# XTSMGRAPHICS reads of the color registers and the sixel geometry, the
+# text area size in pixels and in cells, and DECRQM of xterm's private
+# color registers mode; DA1 is sent after them
+_CAPABILITIES_QUERY = ("\x1b[?1;1;0S\x1b[?2;1;0S\x1b[14t\x1b[18t"
+                       "\x1b[?1070$p")
+# DECRPM mode values meaning set and permanently set, reset and
+# permanently reset
+_MODE_VALUES = {"1": True, "3": True, "2": False, "4": False}
+
+_cache = {}
 
 
 def get_terminal_size_windows():
@@ -68,46 +101,279 @@ def __reset_raw(old):
     termios.tcsetattr(fd, termios.TCSAFLUSH, old)
 
 
-def __get_report(query):
-    """Sends a query to the terminal and returns the response."""
-    result = ""
+def __get_winsize(fd):
+    """Returns rows, columns and pixel width and height from the kernel."""
+    try:
+        packed = fcntl.ioctl(fd, termios.TIOCGWINSZ, struct.pack("HHHH", 0, 0, 0, 0))
+    except OSError:
+        return 0, 0, 0, 0
+    return struct.unpack("HHHH", packed)
+
+
+def __get_reports(query, timeout):
+    """Sends queries followed by DA1 and returns the reports and round-trip.
+
+    Terminals answer in order, so the DA1 answer, which virtually every
+    terminal sends, marks the end of the reports.  Reports are returned as
+    (private marker, parameters, final character) tuples.
+    """
     fd = sys.stdin.fileno()
-    rfds = [fd]
-    wfds = []
-    xfds = []
+    data = ""
 
-    sys.stdout.write(query)
+    sys.stdout.write(query + "\x1b[c")
     sys.stdout.flush()
 
-    rfd, wfd, xfd = select.select(rfds, wfds, xfds, 0.5)
-    if rfd:
-        result = os.read(fd, 1024)
-        return result[:-1].split(";")
-    return None
+    start = time.monotonic()
+    deadline = start + timeout
+    drained = False
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            if drained:
+                return _REPORT.findall(data), None
+            # Give late answers, DA1 last, a little longer to arrive
+            drained = True
+            deadline += DRAIN_TIMEOUT
+            continue
+        rfd, wfd, xfd = select.select([fd], [], [], remaining)
+        if not rfd:
+            continue
+        data += os.read(fd, 1024).decode("latin-1")
+        reports = _REPORT.findall(data)
+        if reports and reports[-1][0] == "?" and reports[-1][2] == "c":
+            return reports, time.monotonic() - start
+
+
+def __terminal_key(fd, winsize):
+    """Returns the cache key of the terminal in its current window size.
+
+    The session id keeps a pty reused by another terminal or font from
+    getting the answers of the last one, and the window size changes
+    with the cell size.
+    """
+    try:
+        tty = os.ttyname(fd)
+    except OSError:
+        tty = ""
+    return "%s:%s:%d:%d:%d:%d:%d" % ((os.getenv("TERM", ""), tty, os.getsid(0))
+                                     + tuple(winsize))
+
+
+def __load_disk_cache():
+    try:
+        with open(os.path.join(get_rcdir(), CACHE_FILE)) as f:
+            entries = json.load(f)
+    except (OSError, ValueError):
+        entries = {}
+    entries.setdefault("sizes", {})
+    entries.setdefault("latency", {})
+    entries.setdefault("capabilities", {})
+    return entries
+
+
+def __store_disk_cache(entries):
+    for name in ("sizes", "capabilities"):
+        keys = list(entries[name])
+        for key in keys[:-MAX_CACHE_ENTRIES]:
+            del entries[name][key]
+    path = os.path.join(get_rcdir(), CACHE_FILE)
+    try:
+        os.makedirs(get_rcdir(), exist_ok=True)
+        with open(path + ".tmp", "w") as f:
+            json.dump(entries, f)
+        os.replace(path + ".tmp", path)
+    except OSError:
+        pass
+
+
+def __query_timeout(latency):
+    """Returns how long to wait for a terminal with a known round-trip."""
+    if latency is None:
+        # The terminal did not answer last time
+        return MIN_QUERY_TIMEOUT
+    return min(QUERY_TIMEOUT, max(MIN_QUERY_TIMEOUT, latency * TIMEOUT_FACTOR))
 
 
 def get_size():
-    """Gets the character width and height of the terminal."""
+    """Gets the character width and height of the terminal.
+
+    The kernel window size is used when it knows the pixel size.  Otherwise
+    the terminal is asked in a single round-trip, waiting as long as its
+    last measured round-trip suggests.  Answers are cached per terminal,
+    session and window size, in memory and in the rc directory.
+    """
     if platform.system() == "Windows":
         # Use Windows-specific method to get terminal size
 
         return 1, 1  # Doesn't make sense on windows
+
+    fd = sys.stdin.fileno()
+    rows, columns, xpixel, ypixel = winsize = __get_winsize(fd)
+    if rows and columns and xpixel and ypixel:
+        return xpixel / columns, ypixel / rows
+
+    key = __terminal_key(fd, winsize)
+    if key in _cache:
+        return _cache[key]
+
+    entries = __load_disk_cache()
+    if key in entries["sizes"]:
+        _cache[key] = tuple(entries["sizes"][key])
+        return _cache[key]
+
+    term = os.getenv("TERM", "")
+    if term in entries["latency"]:
+        timeout = __query_timeout(entries["latency"][term])
     else:
-        # Use ANSI escape codes to query terminal size
+        timeout = QUERY_TIMEOUT
+
+    # Use ANSI escape codes to query terminal size
+
+    backup_termios = __set_raw()
+    try:
+        reports, latency = __get_reports("\x1b[14t\x1b[18t", timeout)
+    finally:
+        __reset_raw(backup_termios)
+
+    height = width = row = column = None
+    for private, params, final in reports:
+        params = params.split(";")
+        if final == "t" and len(params) == 3 and params[0] == "4":
+            height, width = params[1:]
+        elif final == "t" and len(params) == 3 and params[0] == "8":
+            row, column = params[1:]
+
+    if None in (height, width, row, column) or "0" in (row, column):
+        char_width, char_height = 1, 1
+    else:
+        char_width = int(width) / int(column)
+        char_height = int(height) / int(row)
+
+    _cache[key] = char_width, char_height
+    if latency is not None:
+        entries["sizes"][key] = [char_width, char_height]
+    entries["latency"][term] = latency
+    __store_disk_cache(entries)
+    return char_width, char_height
+
+
+class TerminalCapabilities:
+    """What a terminal reported about its graphics, None where unknown.
+
+    ``sixel`` tells whether DA1 lists sixel graphics, ``colors`` is the
+    number of color registers and ``max_width`` and ``max_height`` the
+    largest sixel image shown, as reported by XTSMGRAPHICS.  ``width``
+    and ``height`` are the text area in pixels and ``rows`` and
+    ``columns`` in cells.  ``private_registers`` tells whether color
+    registers are reset per image.
+    """
+
+    FIELDS = ("sixel", "colors", "max_width", "max_height", "width",
+              "height", "rows", "columns", "private_registers")
+
+    def __init__(self, **fields):
+        for name in self.FIELDS:
+            setattr(self, name, fields.get(name))
+
+    @property
+    def max_size(self):
+        """Returns the largest sixel image size, or None."""
+        if self.max_width and self.max_height:
+            return self.max_width, self.max_height
+        return None
+
+    @property
+    def cell_size(self):
+        """Returns the width and height of a cell in pixels, or None."""
+        if self.width and self.height and self.rows and self.columns:
+            return self.width / self.columns, self.height / self.rows
+        return None
+
+    def as_dict(self):
+        return dict((name, getattr(self, name)) for name in self.FIELDS)
+
+    def __repr__(self):
+        return "TerminalCapabilities(%s)" % ", ".join(
+            "%s=%r" % item for item in self.as_dict().items())
+
+
+def __parse_capabilities(reports):
+    fields = {}
+    for private, params, final in reports:
+        params = params.split(";")
+        if final == "S" and len(params) >= 3 and params[1] == "0":
+            if params[0] == "1":
+                fields["colors"] = int(params[2])
+            elif params[0] == "2" and len(params) == 4:
+                fields["max_width"] = int(params[2])
+                fields["max_height"] = int(params[3])
+        elif final == "t" and len(params) == 3 and params[0] == "4":
+            fields["height"], fields["width"] = int(params[1]), int(params[2])
+        elif final == "t" and len(params) == 3 and params[0] == "8":
+            fields["rows"], fields["columns"] = int(params[1]), int(params[2])
+        elif final == "c" and private == "?":
+            fields["sixel"] = "4" in params[1:]
+        elif final == "$y" and len(params) == 2 and params[0] == "1070":
+            fields["private_registers"] = _MODE_VALUES.get(params[1])
+    return fields
+
+
+def get_capabilities():
+    """Asks the terminal about its graphics capabilities.
+
+    All queries are sent in one raw mode session, waiting as long as the
+    terminal's last measured round-trip suggests.  Answers are cached per
+    terminal, session and window size, in memory and in the rc directory.  Returns
+    empty :class:`TerminalCapabilities` when stdin or stdout is not a
+    terminal.
+    """
+    if platform.system() == "Windows":
+        return TerminalCapabilities()
+    fd = sys.stdin.fileno()
+    if not (os.isatty(fd) and os.isatty(sys.stdout.fileno())):
+        return TerminalCapabilities()
+
+    rows, columns, xpixel, ypixel = winsize = __get_winsize(fd)
+    key = "capabilities:" + __terminal_key(fd, winsize)
+    if key in _cache:
+        return _cache[key]
+
+    entries = __load_disk_cache()
+    if key in entries["capabilities"]:
+        _cache[key] = TerminalCapabilities(**entries["capabilities"][key])
+        return _cache[key]
+
+    term = os.getenv("TERM", "")
+    if term in entries["latency"]:
+        timeout = __query_timeout(entries["latency"][term])
+    else:
+        timeout = QUERY_TIMEOUT
+
+    backup_termios = __set_raw()
+    try:
+        reports, latency = __get_reports(_CAPABILITIES_QUERY, timeout)
+    finally:
+        __reset_raw(backup_termios)
+
+    fields = __parse_capabilities(reports)
+    if rows and columns and xpixel and ypixel:
+        # The kernel knows the window size even if the terminal did not say
+        fields.update(rows=rows, columns=columns, width=xpixel, height=ypixel)
+    capabilities = TerminalCapabilities(**fields)
 
-        backup_termios = __set_raw()
-        try:
-            height_width = __get_report("\x1b[14t")
-            row_column = __get_report("\x1b[18t")
+    _cache[key] = capabilities
+    if latency is not None:
+        entries["capabilities"][key] = capabilities.as_dict()
+    entries["latency"][term] = latency
+    __store_disk_cache(entries)
+    return capabilities
 
-            if height_width is None or row_column is None:
-                return 1, 1
 
-            height, width = height_width[1:]
-            row, column = row_column[1:]
+def get_private_registers():
+    """Returns whether the terminal resets its color registers per image.
 
-            char_width = int(width) / int(column)
-            char_height = int(height) / int(row)
-        finally:
-            __reset_raw(backup_termios)
-        return char_width, char_height
+    This is xterm's private color registers mode, read with DECRQM as part
+    of :func:`get_capabilities`.  None is returned when the terminal does
+    not know the mode, or stdin or stdout is not a terminal.
+    """
+    return get_capabilities().private_registers
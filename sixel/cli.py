@@ -0,0 +1,738 @@
+# -*- coding: utf-8 -*-
+# Copyright 2012-2014 Hayaki Saito <user@zuse.jp>
+# Copyright 2023 Lubosz Sarnecki <lubosz@gmail.com>
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# Windows fixed fork by Simon Kalmi Claesson @sbamboo
+
+import os
+import sys
+import optparse
+
+from .__about__ import __version__
+from .registers import REGISTER_MODES, ColorRegisters
+
+# Same names as converter.RESAMPLE_FILTERS, which needs Pillow
+RESAMPLE_CHOICES = ("bicubic", "bilinear", "box", "hamming", "lanczos", "nearest")
+# Same as quantize.QUANTIZERS and quantize.DITHERS
+QUANTIZER_CHOICES = ("median-cut", "octree", "kmeans", "xterm256", "websafe",
+                     "grayscale")
+DITHER_CHOICES = ("none", "bayer", "floyd-steinberg")
+# Bytes of piped input kept in memory before spooling to a temporary file
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+
+def _filenize(f):
+    import shutil
+    import stat
+    import tempfile
+
+    f = getattr(f, "buffer", f)
+    mode = os.fstat(f.fileno()).st_mode
+    if stat.S_ISFIFO(mode) or os.isatty(f.fileno()):
+        # Pillow needs to seek, spool large input to disk instead of memory
+        spool = tempfile.SpooledTemporaryFile(SPOOL_MAX_SIZE)
+        shutil.copyfileobj(f, spool)
+        spool.seek(0)
+        return spool
+    return f
+
+
+def _cell_height(char_height):
+    # Only a whole number of pixels per cell row can be used for positioning
+    if char_height and char_height == int(char_height):
+        return int(char_height)
+    return None
+
+
+def _expand(patterns):
+    # Shells do not expand quoted patterns, and Windows shells never do
+    import glob
+
+    paths = []
+    for pattern in patterns:
+        if any(c in pattern for c in "*?["):
+            paths.extend(sorted(glob.glob(pattern)))
+        else:
+            paths.append(pattern)
+    return paths
+
+
+def _setup_logging():
+    import logging
+    from .rc import get_rcdir
+
+    class LazyFileHandler(logging.FileHandler):
+        # The log directory and file are only created once something is logged
+        def _open(self):
+            os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+            return logging.FileHandler._open(self)
+
+    logfile = os.path.join(get_rcdir(), "log", "log.txt")
+    logging.basicConfig(handlers=[LazyFileHandler(logfile, mode="w", delay=True)])
+
+
+def _batch(paths, options, width, height):
+    from .batch import convert_many
+
+    converted = skipped = failed = 0
+    for result in convert_many(
+        paths,
+        options.output_dir,
+        jobs=options.jobs,
+        force=options.force,
+        body_only=options.body_only,
+        f8bit=options.f8bit,
+        w=width,
+        h=height,
+        ncolor=int(options.ncolor),
+        alpha_threshold=options.alpha_threshold,
+        chromakey=options.chromakey,
+        fast=options.fast,
+        packed=options.packed,
+        resample=options.resample,
+        fit=options.fit,
+        quantizer=options.quantizer,
+        dither=options.dither,
+        optimize=int(options.optimize),
+    ):
+        if result.error is not None:
+            failed += 1
+            sys.stderr.write("%s: %s\n" % (result.path, result.error))
+        elif result.skipped:
+            skipped += 1
+        else:
+            converted += 1
+    sys.stderr.write("%d converted, %d up to date, %d failed\n"
+                     % (converted, skipped, failed))
+    return 1 if failed else 0
+
+
+def main():
+    parser = optparse.OptionParser()
+
+    parser.add_option(
+        "-8",
+        "--8bit-mode",
+        action="store_true",
+        dest="f8bit",
+        help="Generate a sixel image for 8bit terminal or printer",
+    )
+
+    parser.add_option(
+        "-7",
+        "--7bit-mode",
+        action="store_false",
+        dest="f8bit",
+        help="Generate a sixel image for 7bit terminal or printer",
+    )
+
+    parser.add_option(
+        "-r",
+        "--relative-position",
+        action="store_false",
+        default=False,
+        dest="fabsolute",
+        help="Treat specified position as relative one",
+    )
+
+    parser.add_option(
+        "-a",
+        "--absolute-position",
+        action="store_true",
+        dest="fabsolute",
+        help="Treat specified position as absolute one",
+    )
+
+    parser.add_option(
+        "-x",
+        "--left",
+        action="store",
+        dest="left",
+        help="Left position in cell size, or pixel size with unit 'px'",
+    )
+
+    parser.add_option(
+        "-y",
+        "--top",
+        action="store",
+        dest="top",
+        help="Top position in cell size, or pixel size with unit 'px'",
+    )
+
+    parser.add_option(
+        "-w",
+        "--width",
+        action="store",
+        dest="width",
+        help="Width in cell size, or pixel size with unit 'px'",
+    )
+
+    parser.add_option(
+        "-e",
+        "--height",
+        action="store",
+        dest="height",
+        help="Height in cell size, or pixel size with unit 'px'",
+    )
+
+    parser.add_option(
+        "-t",
+        "--alpha-threshold",
+        action="store",
+        type="int",
+        dest="alpha_threshold",
+        default="0",
+        help="Alpha threshold for PNG-to-SIXEL image conversion",
+    )
+
+    parser.add_option(
+        "-c",
+        "--chromakey",
+        dest="chromakey",
+        default=False,
+        action="store_true",
+        help="Enable auto chroma key processing",
+    )
+
+    parser.add_option(
+        "-n",
+        "--ncolor",
+        action="store",
+        type="int",
+        dest="ncolor",
+        default=256,
+        help="Specify number of colors",
+    )
+
+    parser.add_option(
+        "--quantizer",
+        action="store",
+        type="choice",
+        choices=QUANTIZER_CHOICES,
+        dest="quantizer",
+        default=None,
+        help="Palette chosen per image (median-cut, octree, kmeans) or fixed "
+        "(xterm256, websafe, grayscale), median-cut by default",
+    )
+
+    parser.add_option(
+        "--dither",
+        action="store",
+        type="choice",
+        choices=DITHER_CHOICES,
+        dest="dither",
+        default=None,
+        help="Dithering (%s), none by default" % ", ".join(DITHER_CHOICES),
+    )
+
+    parser.add_option(
+        "--resample",
+        action="store",
+        type="choice",
+        choices=RESAMPLE_CHOICES,
+        dest="resample",
+        default=None,
+        help="Resampling filter used for scaling (%s), bicubic by default"
+        % ", ".join(RESAMPLE_CHOICES),
+    )
+
+    parser.add_option(
+        "--fit",
+        action="store_true",
+        dest="fit",
+        default=False,
+        help="Keep the aspect ratio, fitting the image within the width and height",
+    )
+
+    parser.add_option(
+        "--max-memory",
+        action="store",
+        type="int",
+        dest="max_memory",
+        metavar="MB",
+        default=None,
+        help="Scale, quantize and encode in strips, using about MB megabytes "
+        "for very large images",
+    )
+
+    parser.add_option(
+        "-b",
+        "--body-only",
+        action="store_true",
+        dest="body_only",
+        default=False,
+        help="Output sixel without header and DCS envelope",
+    )
+
+    parser.add_option(
+        "-f",
+        "--fast",
+        action="store_true",
+        dest="fast",
+        default=True,
+        help="The speed priority mode (default)",
+    )
+
+    parser.add_option(
+        "-s",
+        "--size",
+        action="store_false",
+        dest="fast",
+        default=True,
+        help="The size priority mode",
+    )
+
+    parser.add_option(
+        "-p",
+        "--packed",
+        action="store_true",
+        dest="packed",
+        default=False,
+        help="Pack 6 pixel rows per sixel band in the speed priority mode, the alpha threshold mode always does",
+    )
+
+    parser.add_option(
+        "-O",
+        "--optimize",
+        action="store",
+        type="choice",
+        choices=("0", "1", "2", "3"),
+        dest="optimize",
+        metavar="LEVEL",
+        default="0",
+        help="Minimize the output size at LEVEL 1 to 3, slower at higher "
+        "levels, 0 (the default) keeps the encoder of the mode",
+    )
+
+    parser.add_option(
+        "-j",
+        "--jobs",
+        action="store",
+        type="int",
+        dest="jobs",
+        default=None,
+        help="Encode sixel bands in JOBS parallel processes, "
+        "or convert JOBS files at once with --output-dir",
+    )
+
+    parser.add_option(
+        "-o",
+        "--output-dir",
+        action="store",
+        dest="output_dir",
+        default=None,
+        help="Convert all given images to .six files in OUTPUT_DIR",
+    )
+
+    parser.add_option(
+        "--force",
+        action="store_true",
+        dest="force",
+        default=False,
+        help="Convert images even if their .six file is up to date",
+    )
+
+    parser.add_option(
+        "--grid",
+        action="store",
+        dest="grid",
+        metavar="COLSxROWS",
+        default=None,
+        help="Draw all given images as thumbnails in one sixel, COLS per row, "
+        "with at most ROWS rows; -w and -e size the whole grid",
+    )
+
+    parser.add_option(
+        "--labels",
+        action="store_true",
+        dest="labels",
+        default=False,
+        help="Write the file name under every thumbnail of --grid",
+    )
+
+    parser.add_option(
+        "--animate",
+        action="store_true",
+        dest="animate",
+        default=False,
+        help="Play all frames of an animated image",
+    )
+
+    parser.add_option(
+        "--loop",
+        action="store",
+        type="int",
+        dest="loop",
+        default=1,
+        help="Number of times to play an animation, 0 for forever",
+    )
+
+    parser.add_option(
+        "--chunk-size",
+        action="store",
+        type="int",
+        dest="chunk_size",
+        metavar="BYTES",
+        default=None,
+        help="Write to stdout in chunks of BYTES, waiting for a slow terminal "
+        "to drain in between",
+    )
+
+    parser.add_option(
+        "--max-rate",
+        action="store",
+        type="float",
+        dest="max_rate",
+        metavar="RATE",
+        default=None,
+        help="Send at most RATE bytes per second",
+    )
+
+    parser.add_option(
+        "--write-timeout",
+        action="store",
+        type="float",
+        dest="write_timeout",
+        metavar="SECONDS",
+        default=None,
+        help="Give up when the terminal accepts nothing for SECONDS, "
+        "ending the image cleanly",
+    )
+
+    parser.add_option(
+        "--no-probe",
+        action="store_false",
+        dest="probe",
+        default=True,
+        help="Do not ask the terminal for its colors, largest image and cell size",
+    )
+
+    parser.add_option(
+        "--registers",
+        action="store",
+        type="choice",
+        choices=REGISTER_MODES,
+        dest="registers",
+        default="private",
+        help="Whether the terminal keeps color registers between images "
+        "(private: no, shared: yes, auto: ask it), colors it holds are not "
+        "sent again",
+    )
+
+    parser.add_option(
+        "--no-cache",
+        action="store_false",
+        dest="cache",
+        default=True,
+        help="Do not read or store encoded images in the cache",
+    )
+
+    parser.add_option(
+        "--cache-dir",
+        action="store",
+        dest="cache_dir",
+        default=None,
+        help="Directory of the encoded image cache",
+    )
+
+    parser.add_option(
+        "--daemon",
+        action="store_true",
+        dest="daemon",
+        default=False,
+        help="Serve --client requests over a Unix socket until idle",
+    )
+
+    parser.add_option(
+        "--client",
+        action="store_true",
+        dest="client",
+        default=False,
+        help="Render through a running daemon, in process if there is none",
+    )
+
+    parser.add_option(
+        "--socket",
+        action="store",
+        dest="socket",
+        default=None,
+        help="Unix socket of the daemon, ~/.pysixel/daemon.sock by default",
+    )
+
+    parser.add_option(
+        "--idle-timeout",
+        action="store",
+        type="float",
+        dest="idle_timeout",
+        default=600,
+        help="Seconds without requests after which the daemon exits",
+    )
+
+    parser.add_option(
+        "--stats",
+        action="store_true",
+        dest="stats",
+        default=False,
+        help="Print time per stage and counters to stderr",
+    )
+
+    parser.add_option(
+        "--stats-json",
+        action="store_true",
+        dest="stats_json",
+        default=False,
+        help="Print time per stage and counters to stderr as JSON",
+    )
+
+    parser.add_option(
+        "-v",
+        "--version",
+        action="store_true",
+        dest="version",
+        default=False,
+        help="Show version",
+    )
+
+    options, args = parser.parse_args()
+
+    if options.version:
+        print(__version__)
+        sys.exit(0)
+
+    grid = None
+    if options.grid is not None:
+        from .montage import parse_grid
+
+        try:
+            grid = parse_grid(options.grid)
+        except ValueError:
+            parser.error("--grid needs COLSxROWS or COLS, not %r" % options.grid)
+        if not args:
+            parser.error("--grid needs image files")
+        if options.output_dir is not None or options.animate:
+            parser.error("--grid cannot be combined with --output-dir or --animate")
+    elif len(args) > 1 and options.output_dir is None:
+        parser.error("converting several images needs --output-dir or --grid")
+
+    if options.daemon:
+        from .daemon import SixelDaemon
+
+        _setup_logging()
+
+        try:
+            SixelDaemon(options.socket, options.idle_timeout).serve()
+        except KeyboardInterrupt:
+            pass
+        return
+
+    stdin, stdout = sys.stdin, sys.stdout
+    left = options.left
+    top = options.top
+    width = options.width
+    height = options.height
+
+    capabilities = None
+    if options.probe and options.output_dir is None and not options.body_only:
+        from .cellsize import get_capabilities
+
+        # Only asks when both stdin and stdout are the terminal
+        capabilities = get_capabilities()
+        if capabilities.sixel is False:
+            sys.stderr.write("sixelconv: the terminal does not report sixel support\n")
+
+    char_height = None
+    if (left, top, width, height) != (None, None, None, None) or options.animate:
+        if capabilities is not None and capabilities.cell_size:
+            char_width, char_height = capabilities.cell_size
+        elif os.isatty(stdout.fileno()) and os.isatty(stdin.fileno()):
+            from .cellsize import get_size
+
+            try:
+                char_width, char_height = get_size()
+            except Exception:
+                char_width, char_height = (10, 20)
+        else:
+            char_width, char_height = (10, 20)
+
+        if left is not None:
+            pos = left.find("px")
+            if pos > 0:
+                left = int(left[:pos]) / char_width
+            else:
+                left = int(left)
+
+        if top is not None:
+            pos = top.find("px")
+            if pos > 0:
+                top = int(top[:pos]) / char_width
+            else:
+                top = int(top)
+
+        if width is not None:
+            pos = width.find("px")
+            if pos > 0:
+                width = int(width[:pos])
+            else:
+                width = int(width) * char_width
+
+        if height is not None:
+            pos = height.find("px")
+            if pos > 0:
+                height = int(height[:pos])
+            else:
+                height = int(height) * char_height
+
+    from .sixel import SixelWriter
+
+    writer = SixelWriter(f8bit=options.f8bit, body_only=options.body_only,
+                         registers=ColorRegisters.from_mode(options.registers),
+                         capabilities=capabilities)
+
+    if options.cache:
+        from .cache import SixelCache
+
+        cache = SixelCache(options.cache_dir)
+    else:
+        cache = None
+
+    if options.stats or options.stats_json:
+        from .stats import SixelStats
+
+        stats = SixelStats()
+    else:
+        stats = None
+
+    if options.max_memory is not None:
+        max_memory = options.max_memory * 1024 * 1024
+    else:
+        max_memory = None
+
+    output = None
+    try:
+        if options.output_dir is not None:
+            _setup_logging()
+            sys.exit(_batch(_expand(args), options, width, height))
+
+        if grid is not None:
+            from .montage import montage
+
+            # One image and one palette for all files, sized as a whole
+            image_file = montage(_expand(args), *grid, size=(width, height),
+                                 labels=options.labels, resample=options.resample,
+                                 jobs=options.jobs, stats=stats)
+            for path, error in image_file.info["errors"]:
+                sys.stderr.write("%s: %s\n" % (path, error))
+            width = height = None
+        elif len(args) == 0 or args[0] == "-":
+            image_file = _filenize(stdin)
+        else:
+            image_file = args[0]
+
+        if (options.chunk_size, options.max_rate,
+                options.write_timeout) != (None, None, None):
+            from .output import ChunkedWriter
+
+            # Only once stdin was read, a terminal shares its blocking mode
+            stdout.flush()
+            output = ChunkedWriter(stdout.fileno(), options.chunk_size,
+                                   options.max_rate, options.write_timeout)
+        else:
+            output = stdout.buffer
+
+        # Nothing is logged before Pillow is loaded to render here
+        _setup_logging()
+
+        if options.animate:
+            from .animation import SixelAnimation
+
+            # Frames are not drawn through writer.draw(), which caps these
+            ncolor, max_size = writer.capped(int(options.ncolor), None)
+            animation = SixelAnimation(
+                image_file,
+                f8bit=options.f8bit,
+                w=width,
+                h=height,
+                ncolor=ncolor,
+                cell_height=_cell_height(char_height),
+                max_size=max_size,
+            )
+            animation.play(output=output, writer=writer, loop=options.loop)
+            return
+
+        if options.client and stats is None and max_memory is None \
+                and grid is None:
+            from .daemon import DaemonError, SixelClient
+
+            try:
+                SixelClient(options.socket).draw(
+                    writer,
+                    image_file,
+                    output,
+                    absolute=options.fabsolute,
+                    x=left,
+                    y=top,
+                    w=width,
+                    h=height,
+                    ncolor=int(options.ncolor),
+                    alpha_threshold=options.alpha_threshold,
+                    chromakey=options.chromakey,
+                    fast=options.fast,
+                    packed=options.packed,
+                    resample=options.resample,
+                    fit=options.fit,
+                    quantizer=options.quantizer,
+                    dither=options.dither,
+                    optimize=int(options.optimize),
+                )
+                return
+            except (FileNotFoundError, ConnectionRefusedError):
+                pass  # no daemon, render here
+            except DaemonError as e:
+                sys.stderr.write("%s\n" % e)
+                sys.exit(1)
+
+        writer.draw(
+            image_file,
+            output=output,
+            absolute=options.fabsolute,
+            x=left,
+            y=top,
+            w=width,
+            h=height,
+            ncolor=int(options.ncolor),
+            alpha_threshold=options.alpha_threshold,
+            chromakey=options.chromakey,
+            fast=options.fast,
+            packed=options.packed,
+            workers=options.jobs,
+            cache=cache,
+            stats=stats,
+            resample=options.resample,
+            fit=options.fit,
+            max_memory=max_memory,
+            quantizer=options.quantizer,
+            dither=options.dither,
+            optimize=int(options.optimize),
+        )
+    except KeyboardInterrupt:
+        pass
+    except TimeoutError as e:
+        sys.stderr.write("sixelconv: %s\n" % e)
+        sys.exit(1)
+    finally:
+        if output is not None and output is not stdout.buffer:
+            if stats is not None:
+                stats.count("bytes_per_s", int(output.throughput))
+                stats.count("write_waits", output.waits)
+            output.close()
+
+    if stats is not None:
+        if options.stats_json:
+            sys.stderr.write(stats.to_json() + "\n")
+        else:
+            sys.stderr.write(stats.format() + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,11 +5,141 @@
 #
 # Windows fixed fork by Simon Kalmi Claesson @sbamboo
 
-from io import StringIO
+from array import array
 from PIL import Image
 
+from .encoder import (numpy, encode_size_band, encode_size_band_python,
+                      encode_packed_band, encode_packed_band_python,
+                      encode_optimized_band, encode_optimized_band_python)
+from .output import SixelEncoding
+from .parallel import iter_bands
+from .quantize import DEFAULT_QUANTIZER, quantize
+from .registers import PRIVATE_REGISTERS
+from .stats import NULL_STATS
 
-class SixelConverter:
+# Minimal image height per worker for band-parallel encoding
+PARALLEL_MIN_ROWS = 48
+
+RESAMPLE_FILTERS = {
+    "nearest": Image.Resampling.NEAREST,
+    "box": Image.Resampling.BOX,
+    "bilinear": Image.Resampling.BILINEAR,
+    "hamming": Image.Resampling.HAMMING,
+    "bicubic": Image.Resampling.BICUBIC,
+    "lanczos": Image.Resampling.LANCZOS,
+}
+DEFAULT_RESAMPLE = "bicubic"
+# Downscales first reduce() by an integer factor while the image stays at
+# least this many times larger than the target, then resample the rest
+REDUCING_GAP = 3.0
+# Highest level of the size optimizing encoder
+MAX_OPTIMIZE = 3
+# Index that transparent pixels get in the packed alpha encoder, one past
+# the largest palette so they are skipped like a chroma key
+TRANSPARENT = 256
+
+
+def _fit_within(width, height, w, h):
+    scale = min(w / width if w else float("inf"),
+                h / height if h else float("inf"))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def _target_size(size, w, h, fit, max_size=None):
+    """Returns the output size for an image of ``size`` asked for w x h.
+
+    Without ``fit`` a missing dimension keeps the image's own; with it the
+    aspect ratio is kept and the image fits within the given dimensions.
+    A size larger than ``max_size`` is then scaled down to fit within it,
+    keeping its aspect ratio.
+    """
+    width, height = size
+    if fit and (w or h):
+        width, height = _fit_within(width, height, w, h)
+    elif w or h:
+        width, height = int(w or width), int(h or height)
+    if max_size and (width > max_size[0] or height > max_size[1]):
+        width, height = _fit_within(width, height, *max_size)
+    return width, height
+
+
+def _figure_image(figure):
+    """Returns an RGBA image sharing the pixels of a Matplotlib Agg figure."""
+    canvas = figure.canvas
+    if not hasattr(canvas, "buffer_rgba"):
+        raise TypeError("figure needs an Agg based canvas")
+    canvas.draw()
+    buffer = canvas.buffer_rgba()
+    height, width = buffer.shape[:2]
+    return Image.frombuffer("RGBA", (width, height), buffer, "raw", "RGBA", 0, 1)
+
+
+def _as_image(source):
+    """Returns in-memory sources as a PIL image, None for files."""
+    if isinstance(source, Image.Image):
+        return source
+    if hasattr(source, "__array_interface__"):
+        return Image.fromarray(source)
+    if hasattr(source, "canvas") and hasattr(source, "savefig"):
+        return _figure_image(source)
+    return None
+
+
+def _resample_filter(resample):
+    """Returns the Pillow filter of a RESAMPLE_FILTERS name, None or filter."""
+    if resample is None:
+        resample = DEFAULT_RESAMPLE
+    if not isinstance(resample, int):
+        resample = RESAMPLE_FILTERS[resample]
+    return resample
+
+
+def _open_image(file, mode, w=None, h=None, fit=False, max_size=None,
+                resample=DEFAULT_RESAMPLE, stats=NULL_STATS):
+    """Decodes an image in ``mode`` and scales it to the output size.
+
+    ``file`` is a path, a file object or an in-memory image, and the size
+    is the one :func:`_target_size` returns.  JPEG images are decoded at a
+    reduced scale when the target is much smaller, and large downscales
+    start with a cheap integer reduction.
+    """
+    resample = _resample_filter(resample)
+    with stats.stage("open"):
+        image = _as_image(file)
+        if image is None:
+            image = Image.open(file)
+            size = _target_size(image.size, w, h, fit, max_size)
+            if size[0] < image.width and size[1] < image.height:
+                image.draft(mode, size)
+            image.load()
+        else:
+            size = _target_size(image.size, w, h, fit, max_size)
+        if image.mode != mode:
+            image = image.convert(mode)
+    if image.size != size:
+        with stats.stage("resize"):
+            image = image.resize(size, resample, reducing_gap=REDUCING_GAP)
+    return image
+
+
+class SixelConverter(SixelEncoding):
+    """Quantizes an image and encodes it as sixels.
+
+    ``file`` is a path or binary file object of any format Pillow reads, or
+    an in-memory image: a PIL image, a NumPy array or a Matplotlib figure,
+    see :meth:`from_image`, :meth:`from_array`, :meth:`from_buffer` and
+    :meth:`from_figure`.  ``quantizer`` and ``dither`` choose how colors
+    are reduced, see :func:`sixel.quantize.quantize`.
+
+    ``optimize`` from 1 to 3 replaces the encoder of the mode with packed
+    bands encoded in fewer bytes, at the cost of more encoding time.  With
+    ``workers``, levels 2 and 3 carry the selected color over only between
+    the bands of one worker, so the output is a little larger than serially.
+    ``registers``, the :class:`~sixel.registers.ColorRegisters` of the
+    terminal, leaves out definitions of colors it already holds.
+    ``max_size``, e.g. the largest sixel a terminal shows, scales larger
+    output down to fit.
+    """
 
     def __init__(self, file,
                  f8bit=False,
@@ -18,12 +148,29 @@ class SixelConverter:
                  ncolor=256,
                  alpha_threshold=0,
                  chromakey=False,
-                 fast=True):
+                 fast=True,
+                 packed=False,
+                 workers=None,
+                 stats=None,
+                 resample=DEFAULT_RESAMPLE,
+                 fit=False,
+                 quantizer=DEFAULT_QUANTIZER,
+                 dither=None,
+                 optimize=0,
+                 registers=None,
+                 max_size=None):
 
+        if not 0 <= optimize <= MAX_OPTIMIZE:
+            raise ValueError("optimize must be between 0 and %d" % MAX_OPTIMIZE)
         self.__alpha_threshold = alpha_threshold
         self.__chromakey = chromakey
         self._slots = [0] * 257
         self._fast = fast
+        self._packed = packed
+        self._workers = workers
+        self._optimize = optimize
+        self._registers = registers if registers is not None else PRIVATE_REGISTERS
+        self._stats = stats = stats or NULL_STATS
 
         if ncolor >= 256:
             ncolor = 256
@@ -37,29 +184,62 @@ class SixelConverter:
             self.DCS = '\x1bP'
             self.ST = '\x1b\\'
 
-        image = Image.open(file)
-        image = image.convert("RGB").convert("P",
-                                             palette=Image.Palette.ADAPTIVE,
-                                             colors=ncolor)
-        if w or h:
-            width, height = image.size
-            if not w:
-                w = width
-            if not h:
-                h = height
-            image = image.resize((w, h))
+        self._resample = resample
+        self._fit = fit
+        self._max_size = max_size
+        self._quantizer = quantizer
+        self._dither = dither
 
+        if alpha_threshold > 0:
+            # One decode serves both the colors and the alpha mask
+            image = self.__open(file, "RGBA", w, h)
+            self.alpha = image.getchannel("A").tobytes()
+            image = image.convert("RGB")
+        else:
+            image = self.__open(file, "RGB", w, h)
+        with stats.stage("quantize"):
+            image = self._quantize(image, ncolor)
+
+        self._image = image
         self.palette = image.getpalette()
+        # Pillow truncates the palette to the colors actually allocated
+        self._ncolor = min(self._ncolor, len(self.palette) // 3)
         self.data = image.getdata()
         self.width, self.height = image.size
+        if stats.enabled:
+            stats.count("pixels", self.width * self.height)
+            stats.count("colors", len(image.getcolors(256)))
 
-        if alpha_threshold > 0:
-            self.rawdata = Image.open(file).convert("RGBA").getdata()
+    @classmethod
+    def from_image(cls, image, *args, **kwargs):
+        """Converts a PIL image without encoding it to a file first."""
+        return cls(image, *args, **kwargs)
 
-    def __write_header(self, output):
-        # start Device Control String (DCS)
-        output.write(self.DCS)
+    @classmethod
+    def from_array(cls, array, *args, **kwargs):
+        """Converts a uint8 NumPy array of shape (h, w), (h, w, 3) or (h, w, 4)."""
+        return cls(Image.fromarray(array), *args, **kwargs)
+
+    @classmethod
+    def from_buffer(cls, data, size, mode="RGB", *args, **kwargs):
+        """Converts raw pixels of ``mode`` (e.g. RGB or RGBA) and ``size``."""
+        image = Image.frombuffer(mode, size, data, "raw", mode, 0, 1)
+        return cls(image, *args, **kwargs)
 
+    @classmethod
+    def from_figure(cls, figure, *args, **kwargs):
+        """Converts a Matplotlib figure, reading its Agg canvas in place."""
+        return cls(_figure_image(figure), *args, **kwargs)
+
+    def __open(self, file, mode, w, h):
+        return _open_image(file, mode, w, h, self._fit, self._max_size,
+                           self._resample, self._stats)
+
+    def _quantize(self, image, ncolor):
+        """Reduces an RGB image to a palette image of at most ncolor colors."""
+        return quantize(image, ncolor, self._quantizer, self._dither)
+
+    def __header(self):
         # write header
         aspect_ratio = 7  # means 1:1
         if self.__chromakey:
@@ -69,7 +249,8 @@ class SixelConverter:
         dpi = 75  # dummy value
         template = '%d;%d;%dq"1;1;%d;%d'
         args = (aspect_ratio, background_option, dpi, self.width, self.height)
-        output.write(template % args)
+        # start Device Control String (DCS)
+        return self.DCS + template % args
 
     def __write_palette_section(self, output):
 
@@ -83,64 +264,39 @@ class SixelConverter:
             b = palette[i + 2] * 100 / 256
             output.write('#%d;2;%d;%d;%d' % (no, r, g, b))
 
-    def __write_body_without_alpha_threshold(self, output, data):
+    def __palette_section(self):
+        out = []
         for n in range(0, self._ncolor):
             palette = self.palette
             r = palette[n * 3 + 0] * 100 / 256
             g = palette[n * 3 + 1] * 100 / 256
             b = palette[n * 3 + 2] * 100 / 256
-            output.write('#%d;2;%d;%d;%d\n' % (n, r, g, b))
+            definition = self._registers.define(n, r, g, b)
+            if definition:
+                out.append(definition + '\n')
+        return ''.join(out)
+
+    def __iter_body_without_alpha_threshold(self, data):
         height = self.height
         width = self.width
+        if self.__parallel():
+            yield from iter_bands(self._image.tobytes(), width, height,
+                                  self._workers)
+            return
+        if numpy is not None:
+            pixels = numpy.asarray(self._image)
         for y in range(0, height, 6):
-            if height - y <= 5:
-                band = height - y
+            if numpy is not None:
+                yield encode_size_band(pixels[y:y + 6])
             else:
-                band = 6
-            buf = []
-            set_ = set()
-
-            def add_node(n_, s):
-                nodes = []
-                cache = 0
-                count_ = 0
-                if s:
-                    nodes.append((0, s))
-                for x in range(s, width):
-                    count_ += 1
-                    p = y * width + x
-                    six_ = 0
-                    for i in range(0, band):
-                        d = data[p + width * i]
-                        if d == n_:
-                            six_ |= 1 << i
-                        elif d not in set_:
-                            set_.add(d)
-                            add_node(d, x)
-                    if six_ != cache:
-                        nodes.append([cache, count_])
-                        count_ = 0
-                        cache = six_
-                if cache != 0:
-                    nodes.append([cache, count_])
-                buf.append((n_, nodes))
-
-            add_node(data[y * width], 0)
-
-            for n, node in buf:
-                output.write("#%d\n" % n)
-                for six, count in node:
-                    if count < 4:
-                        output.write(chr(0x3f + six) * count)
-                    else:
-                        output.write('!%d%c' % (count, 0x3f + six))
-                output.write("$\n")
-            output.write("-\n")
+                yield encode_size_band_python(data, width, y, min(height - y, 6))
 
-    def __write_body_without_alpha_threshold_fast(self, output, data, key_color):
+    def __iter_body_without_alpha_threshold_fast(self, data, key_color):
         height = self.height
         width = self.width
         n = 1
+        out = []
+        write = out.append
         for y in range(0, height):
             p = y * width
             cached_no = data[p]
@@ -161,12 +317,12 @@ class SixelConverter:
                             g = palette[cached_no * 3 + 1] * 100 / 256
                             b = palette[cached_no * 3 + 2] * 100 / 256
                             self._slots[cached_no] = 1
-                            output.write('#%d;2;%d;%d;%d' % (cached_no, r, g, b))
-                        output.write('#%d' % cached_no)
+                            write(self._registers.define(cached_no, r, g, b))
+                        write('#%d' % cached_no)
                     if count < 3:
-                        output.write(chr(c) * count)
+                        write(chr(c) * count)
                     else:
-                        output.write('!%d%c' % (count, c))
+                        write('!%d%c' % (count, c))
                     count = 1
                     cached_no = color_no
             if c != -1 and count > 1:
@@ -179,104 +335,204 @@ class SixelConverter:
                         g = palette[cached_no * 3 + 1] * 100 / 256
                         b = palette[cached_no * 3 + 2] * 100 / 256
                         self._slots[cached_no] = 1
-                        output.write('#%d;2;%d;%d;%d' % (cached_no, r, g, b))
-                    output.write('#%d' % cached_no)
+                        write(self._registers.define(cached_no, r, g, b))
+                    write('#%d' % cached_no)
                 if count < 3:
-                    output.write(chr(c) * count)
+                    write(chr(c) * count)
                 else:
-                    output.write('!%d%c' % (count, c))
+                    write('!%d%c' % (count, c))
             if n == 32:
                 n = 1
-                output.write('-')  # write sixel line separator
+                write('-')  # write sixel line separator
+                yield ''.join(out)
+                del out[:]
             else:
                 n <<= 1
-                output.write('$')  # write line terminator
+                write('$')  # write line terminator
+        if out:
+            yield ''.join(out)
+
+    def __transparent_indices(self, data, key_color):
+        """Returns the indices with transparent and key pixels TRANSPARENT."""
+        threshold = self.__alpha_threshold
+        if numpy is not None:
+            pixels = numpy.asarray(self._image).astype(numpy.uint16)
+            alpha = numpy.frombuffer(self.alpha, numpy.uint8)
+            skipped = alpha.reshape(pixels.shape) < threshold
+            if key_color != -1:
+                skipped |= pixels == key_color
+            pixels[skipped] = TRANSPARENT
+            return pixels
+        return [TRANSPARENT if a < threshold or c == key_color else c
+                for c, a in zip(data, self.alpha)]
 
-    def __write_body_with_alpha_threshold(self, output, data, key_color):
-        rawdata = self.rawdata
+    def __iter_body_packed(self, data, key_color):
         height = self.height
         width = self.width
-        max_run_length = 255
-        n = 1
-        for y in range(0, height):
-            p = y * width
-            cached_no = data[p]
-            cached_alpha = rawdata[p][3]
-            count = 1
-            c = -1
-            for x in range(0, width):
-                color_no = data[p + x]
-                alpha = rawdata[p + x][3]
-                if color_no == cached_no:
-                    if alpha == cached_alpha:
-                        if count < max_run_length:
-                            count += 1
-                            continue
-                if cached_no == key_color:
-                    c = 0x3f
-                elif cached_alpha < self.__alpha_threshold:
-                    c = 0x3f
-                else:
-                    c = n + 0x3f
-                if count == 1:
-                    output.write('#%d%c' % (cached_no, c))
-                elif count == 2:
-                    output.write('#%d%c%c' % (cached_no, c, c))
-                    count = 1
-                else:
-                    output.write('#%d!%d%c' % (cached_no, count, c))
-                    count = 1
-                cached_no = color_no
-                cached_alpha = alpha
-            if c != -1:
-                if cached_no == key_color:
-                    c = 0x3f
-                if count == 1:
-                    output.write('#%d%c' % (cached_no, c))
-                elif count == 2:
-                    output.write('#%d%c%c' % (cached_no, c, c))
-                else:
-                    output.write('#%d!%d%c' % (cached_no, count, c))
-            output.write('$')  # write line terminator
-            if n == 32:
-                n = 1
-                output.write('-')  # write sixel line separator
+        palette = self.palette
+        if self.__alpha_threshold > 0:
+            data = self.__transparent_indices(data, key_color)
+            key_color = TRANSPARENT
+        if self.__parallel():
+            if self.__alpha_threshold == 0:
+                indices = self._image.tobytes()
+            elif numpy is not None:
+                indices = data.tobytes()
             else:
-                n <<= 1
-
-    def __write_body_section(self, output):
-        data = self.data
-        if self.__chromakey:
-            key_color = data[0]
-        else:
-            key_color = -1
-        if self.__alpha_threshold == 0:
-            if self._fast:
-                self.__write_body_without_alpha_threshold_fast(output, data, key_color)
+                indices = array("H", data).tobytes()
+            bands = iter_bands(indices, width, height, self._workers,
+                               packed=True, key_color=key_color,
+                               wide=self.__alpha_threshold > 0)
+        elif numpy is not None:
+            if self.__alpha_threshold == 0:
+                pixels = numpy.asarray(self._image)
             else:
-                self.__write_body_without_alpha_threshold(output, data)
+                pixels = data
+            bands = (encode_packed_band(pixels[y:y + 6], key_color)
+                     for y in range(0, height, 6))
         else:
-            self.__write_body_with_alpha_threshold(output, data, key_color)
+            bands = (encode_packed_band_python(data, width, y,
+                                               min(height - y, 6), key_color)
+                     for y in range(0, height, 6))
+        for colors, body in bands:
+            out = []
+            for n in colors:
+                if self._slots[n] == 0:
+                    r = palette[n * 3 + 0] * 100 / 256
+                    g = palette[n * 3 + 1] * 100 / 256
+                    b = palette[n * 3 + 2] * 100 / 256
+                    self._slots[n] = 1
+                    out.append(self._registers.define(n, r, g, b))
+            out.append(body)
+            yield ''.join(out)
 
-    def __write_terminator(self, output):
-        # write ST
-        output.write(self.ST)  # terminate Device Control String
+    def __registers(self, key_color):
+        """Returns the register of every index, one per distinct sixel color.
 
-    def getvalue(self):
-        output = StringIO()
+        Colors that round to the same sixel RGB share the register of the
+        first of them; the key color keeps its own.
+        """
+        palette = self.palette
+        registers = list(range(TRANSPARENT + 1))
+        seen = {}
+        for n in range(self._ncolor):
+            if n == key_color:
+                continue
+            rgb = tuple(palette[n * 3 + i] * 100 // 256 for i in range(3))
+            registers[n] = seen.setdefault(rgb, n)
+        return registers
 
-        try:
-            self.write(output)
-            value = output.getvalue()
+    def __iter_body_optimized(self, data, key_color):
+        """Encodes packed bands in as few bytes as the optimize level gets.
 
-        finally:
-            output.close()
+        Level 1 is packed encoding that defines only the registers in use,
+        merges colors that look the same and leaves out carriage returns
+        before a new line.  Level 2 also leaves out the select of the color
+        still selected from the previous band, level 3 also paints colors
+        in the order that needs the fewest sixels.
+        """
+        height = self.height
+        width = self.width
+        palette = self.palette
+        level = self._optimize
+        registers = self.__registers(key_color)
+        if self.__alpha_threshold > 0:
+            data = self.__transparent_indices(data, key_color)
+            key_color = TRANSPARENT
+        wide = self.__alpha_threshold > 0
+        if numpy is not None:
+            if wide:
+                pixels = numpy.array(registers, numpy.uint16)[data]
+            else:
+                pixels = numpy.array(registers[:256], numpy.uint8)[
+                    numpy.asarray(self._image)]
+        else:
+            data = [registers[c] for c in data]
+
+        if self.__parallel():
+            if numpy is not None:
+                indices = pixels.tobytes()
+            elif wide:
+                indices = array("H", data).tobytes()
+            else:
+                indices = bytes(data)
+            bands = iter_bands(indices, width, height, self._workers,
+                               packed=True, key_color=key_color, wide=wide,
+                               optimize=level)
+        else:
+            bands = None
+
+        current = -1
+        for y in range(0, height, 6):
+            first = current if level >= 2 else -1
+            if bands is not None:
+                colors, body = next(bands)
+            elif numpy is not None:
+                colors, body = encode_optimized_band(pixels[y:y + 6],
+                                                     key_color, level, first)
+            else:
+                colors, body = encode_optimized_band_python(
+                    data, width, y, min(height - y, 6), key_color, level,
+                    first)
+            out = []
+            new = [n for n in colors if self._slots[n] == 0]
+            if new and new[0] == colors[0]:
+                # Defining a register selects it, define the first one last
+                new.append(new.pop(0))
+            for n in new:
+                r = palette[n * 3 + 0] * 100 / 256
+                g = palette[n * 3 + 1] * 100 / 256
+                b = palette[n * 3 + 2] * 100 / 256
+                self._slots[n] = 1
+                definition = self._registers.define(n, r, g, b)
+                if definition:
+                    out.append(definition)
+                    current = n
+            if level >= 2 and colors and colors[0] == current:
+                body = body[len('#%d' % current):]
+            out.append(body)
+            if colors:
+                current = colors[-1]
+            yield ''.join(out)
+
+    def __parallel(self):
+        # Bands are only worth a process pool when there are plenty of them
+        if not self._workers or self._workers < 2:
+            return False
+        return self.height >= self._workers * PARALLEL_MIN_ROWS
 
-        return value
+    def __iter_body_section(self):
+        data = self.data
+        if self.__chromakey:
+            key_color = data[0]
+        else:
+            key_color = -1
+        if self._optimize:
+            return self.__iter_body_optimized(data, key_color)
+        if (self._fast and self._packed) or self.__alpha_threshold > 0:
+            # Transparent pixels are left out band by band
+            return self.__iter_body_packed(data, key_color)
+        if self._fast:
+            return self.__iter_body_without_alpha_threshold_fast(data, key_color)
+        else:
+            return self.__iter_body_without_alpha_threshold(data)
 
-    def write(self, output, body_only=False):
+    def _iter_sections(self, body_only):
+        self._slots = [0] * 257
+        stats = self._stats
         if not body_only:
-            self.__write_header(output)
-        self.__write_body_section(output)
+            yield self.__header()
+        if self.__alpha_threshold == 0 and not (self._fast or self._optimize):
+            # the size encoder defines every color up front
+            with stats.stage("palette"):
+                palette = self.__palette_section()
+            yield palette
+        body = stats.iter_stage("encode", self.__iter_body_section())
+        if stats.enabled:
+            for band in body:
+                stats.count("runs", band.count('!'))
+                yield band
+        else:
+            yield from body
         if not body_only:
-            self.__write_terminator(output)
+            yield self.ST  # terminate Device Control String
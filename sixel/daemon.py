@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+# Copyright 2012-2014 Hayaki Saito <user@zuse.jp>
+# Copyright 2023 Lubosz Sarnecki <lubosz@gmail.com>
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# Windows fixed fork by Simon Kalmi Claesson @sbamboo
+
+import errno
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+from io import BytesIO
+
+from .output import ENCODING
+from .rc import get_rcdir
+
+SOCKET_FILE = "daemon.sock"
+# Seconds without requests after which the daemon exits
+DEFAULT_IDLE_TIMEOUT = 600
+# Sixel bands per chunk streamed back to the client
+STREAM_BANDS = 16
+COPY_CHUNK_SIZE = 64 * 1024
+
+# Request options passed on to SixelConverter
+CONVERTER_OPTIONS = ("f8bit", "w", "h", "ncolor", "alpha_threshold",
+                     "chromakey", "fast", "packed", "resample", "fit",
+                     "quantizer", "dither", "optimize", "max_size")
+
+
+class DaemonError(RuntimeError):
+    """The daemon could not render a request."""
+
+
+def socket_path():
+    """Returns the default daemon socket in the rc directory."""
+    return os.path.join(get_rcdir(), SOCKET_FILE)
+
+
+def _is_listening(path):
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        s.connect(path)
+        return True
+    except OSError:
+        return False
+    finally:
+        s.close()
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """Renders one request: a JSON line, then the image bytes if no path."""
+
+    def handle(self):
+        from .cache import cache_key
+        from .converter import SixelConverter
+
+        server = self.server
+        value = converter = None
+        try:
+            request = json.loads(self.rfile.readline())
+            options = dict((k, v) for k, v in request["options"].items()
+                           if k in CONVERTER_OPTIONS)
+            body_only = bool(request.get("body_only"))
+            if request.get("path") is not None:
+                with open(request["path"], "rb") as f:
+                    data = f.read()
+            else:
+                data = self.rfile.read(request["size"])
+            key = cache_key(data, body_only=body_only, **options)
+            value = server.cache.get(key)
+            if value is None:
+                converter = SixelConverter(BytesIO(data), **options)
+        except Exception as e:
+            self.__reply(error="%s: %s" % (type(e).__name__, e))
+            return
+
+        chunks = []
+        try:
+            self.__reply()
+            if value is not None:
+                self.wfile.write(value)
+                return
+            for chunk in converter.iter_encode(body_only, STREAM_BANDS):
+                self.wfile.write(chunk)
+                chunks.append(chunk)
+            server.cache.put(key, b"".join(chunks))
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client went away
+        except Exception:
+            # The client already copies sixels to the terminal, which must
+            # not stay inside the DCS; the error goes to handle_error()
+            if chunks and not body_only:
+                try:
+                    self.wfile.write(converter.ST.encode(ENCODING))
+                except OSError:
+                    pass
+            raise
+
+    def __reply(self, error=None):
+        if error is None:
+            reply = {"ok": True}
+        else:
+            reply = {"ok": False, "error": error}
+        self.wfile.write(json.dumps(reply).encode("utf-8") + b"\n")
+
+
+class SixelDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Renders images for :class:`SixelClient` over a Unix socket.
+
+    Requests are served concurrently, each in its own thread, keeping
+    Pillow, NumPy and an in-memory cache of encoded output warm.  The
+    daemon exits after ``idle_timeout`` seconds without requests.
+    """
+
+    daemon_threads = False
+
+    def __init__(self, path=None, idle_timeout=DEFAULT_IDLE_TIMEOUT, cache=None):
+        from .cache import MemoryCache
+        from . import converter  # noqa: F401, warm before the first request
+
+        if path is None:
+            path = socket_path()
+        if os.path.exists(path):
+            if _is_listening(path):
+                raise OSError(errno.EADDRINUSE,
+                              "a daemon is already listening on %s" % path)
+            os.unlink(path)  # left behind by a daemon that was killed
+        os.makedirs(os.path.dirname(path) or ".", mode=0o700, exist_ok=True)
+
+        self.path = path
+        self.idle_timeout = idle_timeout
+        self.timeout = idle_timeout
+        self.cache = cache if cache is not None else MemoryCache()
+        self._active = 0
+        self._last_request = time.monotonic()
+        self._lock = threading.Lock()
+        # Only the user may connect, from the moment the socket exists
+        umask = os.umask(0o077)
+        try:
+            socketserver.UnixStreamServer.__init__(self, path, _Handler)
+        finally:
+            os.umask(umask)
+
+    def process_request_thread(self, request, client_address):
+        with self._lock:
+            self._active += 1
+        try:
+            socketserver.ThreadingMixIn.process_request_thread(
+                self, request, client_address)
+        finally:
+            with self._lock:
+                self._active -= 1
+                self._last_request = time.monotonic()
+
+    def idle(self):
+        """Returns True if nothing was requested for idle_timeout seconds."""
+        with self._lock:
+            if self._active:
+                return False
+            return time.monotonic() - self._last_request >= self.idle_timeout
+
+    def serve(self):
+        """Serves requests until the daemon has been idle long enough."""
+        try:
+            while not self.idle():
+                self.handle_request()
+        finally:
+            self.server_close()
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+
+class SixelClient:
+    """Draws images through a running :class:`SixelDaemon`.
+
+    Connecting raises OSError when no daemon is listening, so callers can
+    fall back to rendering in process.
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            path = socket_path()
+        self.path = path
+
+    def connect(self):
+        """Returns a socket connected to the daemon."""
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            s.connect(self.path)
+        except OSError:
+            s.close()
+            raise
+        return s
+
+    def request(self, image, output, body_only=False, connection=None,
+                **options):
+        """Renders a path or binary file and copies the sixels to output."""
+        header = {"options": options, "body_only": body_only}
+        if hasattr(image, "read"):
+            data = image.read()
+            header["size"] = len(data)
+        else:
+            data = b""
+            header["path"] = os.path.abspath(image)
+
+        s = connection if connection is not None else self.connect()
+        try:
+            s.sendall(json.dumps(header).encode("utf-8") + b"\n" + data)
+            with s.makefile("rb") as f:
+                reply = json.loads(f.readline() or b"{}")
+                if not reply.get("ok"):
+                    raise DaemonError(reply.get("error", "no reply from daemon"))
+                while True:
+                    chunk = f.read1(COPY_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    output.write(chunk)
+        finally:
+            s.close()
+
+    def draw(self, writer, image, output, absolute=False, x=None, y=None,
+             **options):
+        """Like :meth:`SixelWriter.draw`, with the rendering done remotely.
+
+        Nothing is written if the daemon cannot be reached.
+        """
+        connection = self.connect()
+        try:
+            image.seek(0)
+        except Exception:
+            pass
+        options["ncolor"], options["max_size"] = writer.capped(
+            options.get("ncolor", 256), options.get("max_size"))
+        writer.save_position(output)
+        try:
+            if x is not None:
+                writer.move_x(x, absolute, output)
+            if y is not None:
+                writer.move_y(y, absolute, output)
+            self.request(image, output, body_only=writer._body_only,
+                         connection=connection, f8bit=writer.f8bit, **options)
+        except BaseException:
+            writer.abort(output)
+            raise
+        finally:
+            # The daemon defined colors the writer does not know about
+            writer.invalidate_registers()
+        writer.restore_position(output)
@@ -0,0 +1,363 @@
+# -*- coding: utf-8 -*-
+# Copyright 2012-2014 Hayaki Saito <user@zuse.jp>
+# Copyright 2023 Lubosz Sarnecki <lubosz@gmail.com>
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# Windows fixed fork by Simon Kalmi Claesson @sbamboo
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+_SIXEL_CHARS = [chr(0x3f + i) for i in range(64)]
+
+
+def _band_masks(band):
+    """Returns the colors of a band and their 6-bit column masks."""
+    rows, width = band.shape
+    colors, inverse = numpy.unique(band, return_inverse=True)
+    inverse = inverse.reshape(rows, width)
+    sixes = numpy.zeros((len(colors), width), dtype=numpy.uint8)
+    columns = numpy.arange(width)
+    for i in range(rows):
+        sixes[inverse[i], columns] |= 1 << i
+    return colors, sixes
+
+
+def _size_band_order(band, colors):
+    """Returns (color row, start column) pairs in size-mode output order."""
+    rows = band.shape[0]
+    flat = band.T.ravel()
+    first = flat[0]
+    others = numpy.flatnonzero(flat != first)
+    if len(others) == 0:
+        return [(int(numpy.searchsorted(colors, first)), 0)]
+
+    # Every other color is visited from the first column it occurs in, in
+    # column-major order of first occurrence.  The first color is visited
+    # once more from the column holding the first color change, because it
+    # is never recorded as seen by the pure-Python walker.
+    _, starts = numpy.unique(flat, return_index=True)
+    p1 = int(others[0])
+    keys = []
+    for ci, start in enumerate(starts.tolist()):
+        if colors[ci] != first:
+            keys.append((start * 2, ci, start // rows))
+    again = numpy.flatnonzero(flat[p1 - p1 % rows:] == first)
+    if len(again):
+        q = int(again[0]) + p1 - p1 % rows
+        ci = int(numpy.searchsorted(colors, first))
+        keys.append((max(q * 2, p1 * 2 + 1), ci, q // rows))
+    keys.sort()
+
+    order = [(ci, x) for _, ci, x in keys]
+    order.reverse()
+    order.append((int(numpy.searchsorted(colors, first)), 0))
+    return order
+
+
+def _packed_runs(nodes):
+    """Returns the sixel characters of (six, count) runs."""
+    chars = _SIXEL_CHARS
+    runs = []
+    for six, count in nodes:
+        if count < 4:
+            runs.append(chars[six] * count)
+        else:
+            runs.append('!%d%c' % (count, 0x3f + six))
+    return ''.join(runs)
+
+
+def encode_size_band(band):
+    """Encodes one band of palette indices like the size priority mode.
+
+    ``band`` is a 2D NumPy array of at most 6 rows.  The result matches the
+    pure-Python size mode encoder byte for byte.
+    """
+    width = band.shape[1]
+    colors, sixes = _band_masks(band)
+    changes = sixes[:, 1:] != sixes[:, :-1]
+
+    out = []
+    for ci, s in _size_band_order(band, colors):
+        row = sixes[ci]
+        j = numpy.flatnonzero(changes[ci, s:]) + s + 1
+        j = numpy.concatenate(([s], j))
+        values = row[j].tolist()
+        counts = numpy.diff(j).tolist()
+
+        nodes = []
+        if s:
+            nodes.append((0, s))
+        nodes.append((0, 1))
+        nodes.extend(zip(values, counts))
+        if values[-1] != 0:
+            nodes.append((values[-1], width - 1 - int(j[-1])))
+        out.append('#%d\n%s$\n' % (colors[ci], _packed_runs(nodes)))
+    out.append('-\n')
+    return ''.join(out)
+
+
+def encode_size_band_python(data, width, y, band):
+    """Pure-Python counterpart of :func:`encode_size_band`.
+
+    ``data`` is a flat sequence of palette indices, the band starts at row
+    ``y`` and is ``band`` rows high.
+    """
+    out = []
+    write = out.append
+    buf = []
+    set_ = set()
+
+    def add_node(n_, s):
+        nodes = []
+        cache = 0
+        count_ = 0
+        if s:
+            nodes.append((0, s))
+        for x in range(s, width):
+            count_ += 1
+            p = y * width + x
+            six_ = 0
+            for i in range(0, band):
+                d = data[p + width * i]
+                if d == n_:
+                    six_ |= 1 << i
+                elif d not in set_:
+                    set_.add(d)
+                    add_node(d, x)
+            if six_ != cache:
+                nodes.append([cache, count_])
+                count_ = 0
+                cache = six_
+        if cache != 0:
+            nodes.append([cache, count_])
+        buf.append((n_, nodes))
+
+    add_node(data[y * width], 0)
+
+    for n, node in buf:
+        write("#%d\n" % n)
+        for six, count in node:
+            if count < 4:
+                write(chr(0x3f + six) * count)
+            else:
+                write('!%d%c' % (count, 0x3f + six))
+        write("$\n")
+    write("-\n")
+    return ''.join(out)
+
+
+def encode_packed_band(band, key_color=-1):
+    """Encodes one band of palette indices as packed sixels.
+
+    ``band`` is a 2D NumPy array of at most 6 rows.  Every color of the band
+    is painted in one pass over the full band height.  Returns the list of
+    painted colors and the band body, terminated by a graphics new line.
+    """
+    width = band.shape[1]
+    colors, sixes = _band_masks(band)
+
+    used = []
+    out = []
+    for ci, color in enumerate(colors.tolist()):
+        if color == key_color:
+            continue
+        row = sixes[ci]
+        end = int(numpy.flatnonzero(row)[-1]) + 1
+        row = row[:end]
+        starts = numpy.flatnonzero(row[1:] != row[:-1]) + 1
+        starts = numpy.concatenate(([0], starts))
+        counts = numpy.diff(numpy.append(starts, end))
+        nodes = zip(row[starts].tolist(), counts.tolist())
+        used.append(color)
+        out.append('#%d%s$' % (color, _packed_runs(nodes)))
+    out.append('-')
+    return used, ''.join(out)
+
+
+def encode_packed_band_python(data, width, y, band, key_color=-1):
+    """Pure-Python counterpart of :func:`encode_packed_band`.
+
+    ``data`` is a flat sequence of palette indices, the band starts at row
+    ``y`` and is ``band`` rows high.
+    """
+    columns = {}
+    for x in range(width):
+        p = y * width + x
+        for i in range(band):
+            color = data[p + width * i]
+            entry = columns.get(color)
+            if entry is None:
+                columns[color] = [[x, 1 << i]]
+            elif entry[-1][0] == x:
+                entry[-1][1] |= 1 << i
+            else:
+                entry.append([x, 1 << i])
+
+    used = []
+    out = []
+    for color in sorted(columns):
+        if color == key_color:
+            continue
+        nodes = []
+        cache = 0
+        count = 0
+        last = 0
+        for x, six in columns[color]:
+            if x != last:
+                if cache:
+                    nodes.append((cache, count))
+                    cache = 0
+                    count = 0
+                count += x - last
+            if six != cache:
+                if count:
+                    nodes.append((cache, count))
+                cache = six
+                count = 0
+            count += 1
+            last = x + 1
+        nodes.append((cache, count))
+        used.append(color)
+        out.append('#%d%s$' % (color, _packed_runs(nodes)))
+    out.append('-')
+    return used, ''.join(out)
+
+
+def _runs_cost(counts):
+    """Returns the length of runs of ``counts`` pixels as written by _packed_runs."""
+    digits = 1 + (counts >= 10) + (counts >= 100) + (counts >= 1000) \
+        + (counts >= 10000)
+    return int(numpy.where(counts < 4, counts, digits + 2).sum())
+
+
+def _run_lengths(row):
+    """Returns the values and lengths of the runs of a 1D array."""
+    starts = numpy.flatnonzero(row[1:] != row[:-1]) + 1
+    starts = numpy.concatenate(([0], starts))
+    counts = numpy.diff(numpy.append(starts, len(row)))
+    return row[starts], counts
+
+
+def encode_optimized_band(band, key_color=-1, level=3, first=-1):
+    """Encodes one band of palette indices as packed sixels in fewer bytes.
+
+    Like :func:`encode_packed_band`, except that the carriage return before
+    the graphics new line is dropped, and from level 2 the color ``first``,
+    still selected from the previous band, is painted first.  At level 3
+    colors are painted by decreasing pixel count, and a color also paints
+    pixels of colors painted after it wherever that shortens its runs, as
+    those overwrite it.
+    """
+    width = band.shape[1]
+    colors, sixes = _band_masks(band)
+
+    order = [ci for ci, color in enumerate(colors.tolist()) if color != key_color]
+    if level >= 3:
+        pixels = sum((sixes >> i) & 1 for i in range(6)).sum(axis=1)
+        order.sort(key=lambda ci: -int(pixels[ci]))
+    if level >= 2:
+        for i, ci in enumerate(order):
+            if colors[ci] == first:
+                order.insert(0, order.pop(i))
+                break
+
+    rows = {}
+    later = numpy.zeros(width, numpy.uint8)
+    for ci in reversed(order):
+        own = sixes[ci]
+        painted = numpy.flatnonzero(own)
+        start, end = int(painted[0]), int(painted[-1]) + 1
+        row = own[:end]
+        if level >= 3:
+            extended = row | later[:end]
+            extended[:start] = 0
+            if _runs_cost(_run_lengths(extended)[1]) < _runs_cost(_run_lengths(row)[1]):
+                row = extended
+            later |= own
+        rows[ci] = row
+
+    used = []
+    out = []
+    for ci in order:
+        values, counts = _run_lengths(rows[ci])
+        used.append(int(colors[ci]))
+        out.append('#%d%s$' % (colors[ci],
+                               _packed_runs(zip(values.tolist(), counts.tolist()))))
+    if out:
+        out[-1] = out[-1][:-1]
+    out.append('-')
+    return used, ''.join(out)
+
+
+def _runs_python(row):
+    nodes = []
+    cache = row[0]
+    count = 0
+    for six in row:
+        if six != cache:
+            nodes.append((cache, count))
+            cache = six
+            count = 0
+        count += 1
+    nodes.append((cache, count))
+    return nodes
+
+
+def _runs_cost_python(nodes):
+    return sum(count if count < 4 else len(str(count)) + 2 for _, count in nodes)
+
+
+def encode_optimized_band_python(data, width, y, band, key_color=-1, level=3,
+                                 first=-1):
+    """Pure-Python counterpart of :func:`encode_optimized_band`.
+
+    ``data`` is a flat sequence of palette indices, the band starts at row
+    ``y`` and is ``band`` rows high.
+    """
+    sixes = {}
+    pixels = {}
+    for i in range(band):
+        p = (y + i) * width
+        for x in range(width):
+            color = data[p + x]
+            row = sixes.get(color)
+            if row is None:
+                row = sixes[color] = [0] * width
+                pixels[color] = 0
+            row[x] |= 1 << i
+            pixels[color] += 1
+
+    order = [color for color in sorted(sixes) if color != key_color]
+    if level >= 3:
+        order.sort(key=lambda color: -pixels[color])
+    if level >= 2 and first in order:
+        order.remove(first)
+        order.insert(0, first)
+
+    rows = {}
+    later = [0] * width
+    for color in reversed(order):
+        own = sixes[color]
+        painted = [x for x in range(width) if own[x]]
+        start, end = painted[0], painted[-1] + 1
+        row = own[:end]
+        if level >= 3:
+            extended = [0] * start + [six | above for six, above
+                                      in zip(row[start:], later[start:end])]
+            if _runs_cost_python(_runs_python(extended)) \
+                    < _runs_cost_python(_runs_python(row)):
+                row = extended
+            later = [six | above for six, above in zip(own, later)]
+        rows[color] = row
+
+    out = []
+    for color in order:
+        out.append('#%d%s$' % (color, _packed_runs(_runs_python(rows[color]))))
+    if out:
+        out[-1] = out[-1][:-1]
+    out.append('-')
+    return order, ''.join(out)
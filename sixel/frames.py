@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+# Copyright 2012-2014 Hayaki Saito <user@zuse.jp>
+# Copyright 2023 Lubosz Sarnecki <lubosz@gmail.com>
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# Windows fixed fork by Simon Kalmi Claesson @sbamboo
+
+import math
+
+from .output import ENCODING
+
+
+def encode_bands(bands, width, height, encode_band, palette, registers,
+                 DCS, ST, cell_height=None):
+    """Encodes some bands of a frame as one sixel, to be drawn in place.
+
+    ``bands`` are the top rows of the bands to send, in order, and
+    ``encode_band(y, band)`` returns the colors used and the packed body
+    of the ``band`` rows high band at row y.  Bands in between are left
+    blank.  With ``cell_height``, the pixel height of a terminal cell, the
+    sixel starts at the last row above the first band where a cell row and
+    a band both start, so the cursor can be moved down over the rows above.
+
+    Returns the number of rows skipped from the top of the frame and the
+    sixel.  Colors ``registers`` already hold are not defined again.
+    """
+    top = 0
+    if cell_height:
+        unit = 6 * cell_height // math.gcd(6, cell_height)
+        top = bands[0] // unit * unit
+
+    sent = set(bands)
+    colors = set()
+    bodies = []
+    for y in range(top, bands[-1] + 1, 6):
+        if y in sent:
+            used, body = encode_band(y, min(height - y, 6))
+            colors.update(used)
+            bodies.append(body)
+        else:
+            bodies.append('-')
+
+    out = [DCS, '7;1;75q"1;1;%d;%d' % (width, height - top)]
+    for n in sorted(colors):
+        r = palette[n * 3 + 0] * 100 / 256
+        g = palette[n * 3 + 1] * 100 / 256
+        b = palette[n * 3 + 2] * 100 / 256
+        out.append(registers.define(n, r, g, b))
+    out.extend(bodies)
+    out.append(ST)
+    return top, ''.join(out).encode(ENCODING)
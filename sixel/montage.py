@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+# Copyright 2012-2014 Hayaki Saito <user@zuse.jp>
+# Copyright 2023 Lubosz Sarnecki <lubosz@gmail.com>
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# Windows fixed fork by Simon Kalmi Claesson @sbamboo
+
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageDraw, ImageFont
+
+from .converter import DEFAULT_RESAMPLE, _as_image, _resample_filter
+from .stats import NULL_STATS
+
+# Largest size of a thumbnail in pixels
+THUMBNAIL_SIZE = (128, 128)
+# Pixels between and around thumbnails
+DEFAULT_GAP = 4
+
+
+def parse_grid(grid):
+    """Returns the columns and rows of a COLSxROWS grid, rows None if left out."""
+    columns, _, rows = grid.lower().partition("x")
+    columns = int(columns)
+    rows = int(rows) if rows else None
+    if columns < 1 or (rows is not None and rows < 1):
+        raise ValueError("grid needs at least one column and row: %r" % grid)
+    return columns, rows
+
+
+def load_thumbnail(source, size=THUMBNAIL_SIZE, resample=DEFAULT_RESAMPLE):
+    """Returns an image scaled down to fit within ``size``, as RGBA.
+
+    ``source`` is anything :class:`SixelConverter` takes.  JPEG images are
+    decoded at a reduced scale, and images are never scaled up.
+    """
+    image = _as_image(source)
+    if image is None:
+        image = Image.open(source)
+    else:
+        # thumbnail() works in place
+        image = image.copy()
+    image.thumbnail(size, _resample_filter(resample))
+    return image.convert("RGBA")
+
+
+def _label(source, index):
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.basename(source)
+    return getattr(source, "name", None) or str(index + 1)
+
+
+def _fitted(draw, font, text, width):
+    """Returns text shortened to be at most width pixels wide."""
+    if draw.textlength(text, font=font) <= width:
+        return text
+    while text and draw.textlength(text + "..", font=font) > width:
+        text = text[:-1]
+    return text + ".." if text else ""
+
+
+def montage(images,
+            columns,
+            rows=None,
+            cell_size=THUMBNAIL_SIZE,
+            size=None,
+            gap=DEFAULT_GAP,
+            labels=None,
+            background=(0, 0, 0),
+            label_color=(255, 255, 255),
+            resample=DEFAULT_RESAMPLE,
+            jobs=None,
+            stats=None):
+    """Tiles images into one contact sheet.
+
+    Every image is decoded and scaled to fit within ``cell_size`` in a pool
+    of ``jobs`` threads (one per CPU if None; Pillow decodes and scales
+    without holding the GIL) and centered in its cell of a ``columns`` x
+    ``rows`` grid, with as many rows as needed if ``rows`` is None.  Images
+    beyond the grid are left out.  ``size``, the width and height of the
+    whole sheet (either may be None), overrides the matching dimension of
+    ``cell_size``.  ``labels`` is True to write file names under the
+    thumbnails, or a list of labels.
+
+    Returns an RGB image; draw it with :meth:`SixelWriter.draw` to send all
+    thumbnails as one sixel with one palette.  Images that cannot be read
+    leave their cell empty and are listed as (image, error) pairs in the
+    ``errors`` entry of its ``info``.
+    """
+    stats = stats or NULL_STATS
+    images = list(images)
+    if rows is None:
+        rows = max(1, math.ceil(len(images) / columns))
+    images = images[:columns * rows]
+    if labels is True:
+        labels = [_label(image, i) for i, image in enumerate(images)]
+
+    font = None
+    label_height = 0
+    if labels:
+        font = ImageFont.load_default()
+        left, top, right, bottom = font.getbbox("Ag")
+        label_height = bottom + 2
+
+    cell_width, cell_height = cell_size
+    if size is not None:
+        width, height = size
+        if width:
+            cell_width = max(1, (width - gap) // columns - gap)
+        if height:
+            cell_height = max(1, (height - gap) // rows - gap - label_height)
+    # Sizes in cells come from fractional cell sizes
+    cell_width, cell_height = int(cell_width), int(cell_height)
+
+    def load(source):
+        try:
+            return load_thumbnail(source, (cell_width, cell_height), resample)
+        except Exception as e:
+            return "%s: %s" % (type(e).__name__, e)
+
+    with stats.stage("open"):
+        if jobs is None:
+            jobs = os.cpu_count() or 1
+        if jobs <= 1 or len(images) <= 1:
+            thumbnails = [load(image) for image in images]
+        else:
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                thumbnails = list(executor.map(load, images))
+
+    pitch_x = cell_width + gap
+    pitch_y = cell_height + label_height + gap
+    sheet = Image.new("RGB", (columns * pitch_x + gap, rows * pitch_y + gap),
+                      background)
+    draw = ImageDraw.Draw(sheet)
+    errors = []
+    for i, thumbnail in enumerate(thumbnails):
+        x = gap + i % columns * pitch_x
+        y = gap + i // columns * pitch_y
+        if isinstance(thumbnail, str):
+            errors.append((images[i], thumbnail))
+        else:
+            width, height = thumbnail.size
+            sheet.paste(thumbnail, (x + (cell_width - width) // 2,
+                                    y + (cell_height - height) // 2),
+                        thumbnail)
+        if labels and i < len(labels):
+            text = _fitted(draw, font, str(labels[i]), cell_width)
+            offset = (cell_width - draw.textlength(text, font=font)) // 2
+            draw.text((x + offset, y + cell_height + 1), text,
+                      fill=label_color, font=font)
+    sheet.info["errors"] = errors
+    if stats.enabled:
+        stats.count("images", len(images))
+    return sheet
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+# Copyright 2012-2014 Hayaki Saito <user@zuse.jp>
+# Copyright 2023 Lubosz Sarnecki <lubosz@gmail.com>
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# Windows fixed fork by Simon Kalmi Claesson @sbamboo
+
+import atexit
+import io
+import os
+import sys
+import time
+
+from .stats import NULL_STATS
+
+# Sixel streams are 7-bit ASCII, except for the 8-bit DCS, CSI and ST
+# controls which have to reach the terminal as single bytes.
+ENCODING = "latin-1"
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+# Bytes handed to the operating system per write by ChunkedWriter
+TERMINAL_CHUNK_SIZE = 4096
+# Seconds an interrupted image waits for its terminator to be accepted
+ABORT_TIMEOUT = 1.0
+
+
+def is_binary(output):
+    """Returns True if the output stream expects bytes."""
+    if isinstance(output, (io.RawIOBase, io.BufferedIOBase)):
+        return True
+    # asyncio writers only exist once asyncio has been imported
+    asyncio = sys.modules.get("asyncio")
+    if asyncio is None:
+        return False
+    return isinstance(output, (asyncio.StreamWriter, asyncio.WriteTransport))
+
+
+def isatty(output):
+    """Returns True if the output stream is connected to a terminal."""
+    try:
+        return os.isatty(output.fileno())
+    except Exception:
+        return False
+
+
+def write_str(output, s):
+    """Writes a str to a text or binary output stream."""
+    if is_binary(output):
+        output.write(s.encode(ENCODING))
+    else:
+        output.write(s)
+
+
+def write_bytes(output, data):
+    """Writes bytes to a text or binary output stream."""
+    if is_binary(output):
+        output.write(data)
+    else:
+        output.write(data.decode(ENCODING))
+
+
+def stdout():
+    """Returns the binary standard output, falling back to the text one."""
+    try:
+        buffer = sys.stdout.buffer
+    except AttributeError:
+        return sys.stdout
+    sys.stdout.flush()
+    return buffer
+
+
+class SixelOutput:
+    """Encodes str pieces into a reusable buffer and flushes it in chunks.
+
+    The buffer is flushed to ``target`` whenever it is full and on
+    :meth:`flush`.  Binary targets receive the bytes as they are, text
+    targets get them decoded back to str.  Time spent in the target's
+    write is recorded as the ``write`` stage of ``stats``.
+    """
+
+    def __init__(self, target, chunk_size=DEFAULT_CHUNK_SIZE, stats=None):
+        self._target = target
+        self._stats = stats or NULL_STATS
+        self._binary = is_binary(target)
+        self._buffer = bytearray(chunk_size)
+        self._view = memoryview(self._buffer)
+        self._pos = 0
+        self.bytes_written = 0
+
+    def write(self, s):
+        data = s.encode(ENCODING)
+        size = len(data)
+        pos = self._pos
+        if pos + size > len(self._buffer):
+            self.flush()
+            pos = 0
+            if size > len(self._buffer):
+                self._write(data)
+                return
+        self._view[pos:pos + size] = data
+        self._pos = pos + size
+
+    def flush(self):
+        if self._pos:
+            self._write(self._view[:self._pos])
+            self._pos = 0
+
+    def _write(self, data):
+        with self._stats.stage("write"):
+            if self._binary:
+                self._target.write(data)
+            else:
+                self._target.write(str(data, ENCODING))
+        self.bytes_written += len(data)
+
+
+class SixelEncoding:
+    """Output methods shared by the converters.
+
+    Subclasses provide ``_iter_sections(body_only)``, yielding the header,
+    the body bands and the terminator as str, and ``_stats``.
+    """
+
+    def iter_encode(self, body_only=False, bands=1):
+        """Yields the encoded image as bytes while it is being encoded.
+
+        The header comes first, then the body in chunks of ``bands`` sixel
+        bands (6 pixel rows each), then the terminator.
+        """
+        chunk = []
+        for section in self._iter_sections(body_only):
+            chunk.append(section)
+            if len(chunk) >= bands:
+                data = ''.join(chunk).encode(ENCODING)
+                self._stats.count("bytes", len(data))
+                yield data
+                chunk = []
+        if chunk:
+            data = ''.join(chunk).encode(ENCODING)
+            self._stats.count("bytes", len(data))
+            yield data
+
+    def getvalue(self):
+        return self.tobytes().decode(ENCODING)
+
+    def tobytes(self, body_only=False):
+        output = io.BytesIO()
+        try:
+            self.write(output, body_only=body_only)
+            return output.getvalue()
+        finally:
+            output.close()
+
+    def write(self, output, body_only=False, chunk_size=DEFAULT_CHUNK_SIZE):
+        output = SixelOutput(output, chunk_size, self._stats)
+        for section in self._iter_sections(body_only):
+            output.write(section)
+        output.flush()
+        self._stats.count("bytes", output.bytes_written)
+
+
+class ChunkedWriter(io.RawIOBase):
+    """Writes bytes to a file descriptor in chunks, waiting for it to drain.
+
+    Where poll() is available the descriptor is put in non-blocking mode
+    for the life of the writer, so a terminal or link that does not keep
+    up is waited for between chunks instead of blocking inside write(),
+    and ``timeout`` seconds without any progress raise TimeoutError.
+    ``max_rate`` caps the bytes sent per second.  :meth:`close` restores
+    the blocking mode, which the descriptor shares with every process
+    writing to the same terminal, and does not close the descriptor.  It
+    is also restored at exit and, when created in the main thread, on
+    SIGTERM before the previous handler runs.
+
+    ``bytes_written``, ``elapsed`` (seconds spent writing, waits included)
+    and ``throughput`` report what was achieved.
+    """
+
+    def __init__(self, fd, chunk_size=TERMINAL_CHUNK_SIZE, max_rate=None,
+                 timeout=None):
+        if hasattr(fd, "fileno"):
+            fd = fd.fileno()
+        self._fd = fd
+        self._chunk_size = chunk_size or TERMINAL_CHUNK_SIZE
+        self._max_rate = max_rate
+        self.timeout = timeout
+        self._next = 0.0
+        self._poller = None
+        self._blocking = None
+        self._sigterm = None
+        self.bytes_written = 0
+        self.elapsed = 0.0
+        self.waits = 0
+
+        import select
+
+        if hasattr(select, "poll"):
+            self._blocking = os.get_blocking(fd)
+            os.set_blocking(fd, False)
+            self._poller = select.poll()
+            self._poller.register(fd, select.POLLOUT)
+            atexit.register(self.close)
+            self.__catch_sigterm()
+
+    @property
+    def throughput(self):
+        """Bytes written per second spent writing."""
+        if not self.elapsed:
+            return 0.0
+        return self.bytes_written / self.elapsed
+
+    def fileno(self):
+        return self._fd
+
+    def writable(self):
+        return True
+
+    def close(self):
+        if self._blocking is not None and not self.closed:
+            os.set_blocking(self._fd, self._blocking)
+            atexit.unregister(self.close)
+            self.__release_sigterm()
+        super().close()
+
+    def __catch_sigterm(self):
+        import signal
+        import threading
+
+        if threading.current_thread() is not threading.main_thread():
+            return
+        previous = signal.getsignal(signal.SIGTERM)
+        if previous in (signal.SIG_IGN, None):
+            return
+        self._sigterm = previous
+        signal.signal(signal.SIGTERM, self.__on_sigterm)
+
+    def __release_sigterm(self):
+        import signal
+
+        previous, self._sigterm = self._sigterm, None
+        if previous is None:
+            return
+        # Another handler may have been installed on top of this one
+        if signal.getsignal(signal.SIGTERM) == self.__on_sigterm:
+            signal.signal(signal.SIGTERM, previous)
+
+    def __on_sigterm(self, signum, frame):
+        previous = self._sigterm
+        self.close()
+        # The default action, or an int from signal(2) outside Python
+        if callable(previous):
+            previous(signum, frame)
+        else:
+            os.kill(os.getpid(), signum)
+
+    def __wait(self):
+        self.waits += 1
+        timeout = None if self.timeout is None else self.timeout * 1000
+        if not self._poller.poll(timeout):
+            raise TimeoutError("output accepted nothing for %g seconds"
+                               % self.timeout)
+
+    def __throttle(self):
+        delay = self._next - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def write(self, data):
+        view = memoryview(data).cast("B")
+        start = time.perf_counter()
+        try:
+            pos = 0
+            while pos < len(view):
+                chunk = view[pos:pos + self._chunk_size]
+                if self._max_rate:
+                    self.__throttle()
+                try:
+                    n = os.write(self._fd, chunk)
+                except BlockingIOError:
+                    self.__wait()
+                    continue
+                if self._max_rate:
+                    # The next chunk is due once these bytes took their share
+                    self._next = time.monotonic() + n / self._max_rate
+                pos += n
+                self.bytes_written += n
+        finally:
+            self.elapsed += time.perf_counter() - start
+        return len(view)
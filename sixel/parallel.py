@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+# Copyright 2012-2014 Hayaki Saito <user@zuse.jp>
+# Copyright 2023 Lubosz Sarnecki <lubosz@gmail.com>
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# Windows fixed fork by Simon Kalmi Claesson @sbamboo
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+from .encoder import (numpy, encode_size_band, encode_size_band_python,
+                      encode_packed_band, encode_packed_band_python,
+                      encode_optimized_band, encode_optimized_band_python)
+
+# Band ranges handed out per worker, more than one so slow ranges even out
+RANGES_PER_WORKER = 4
+
+
+def _encode_range(name, width, height, y0, y1, packed, key_color, wide,
+                  optimize):
+    """Encodes the bands between rows y0 and y1 of a shared index buffer."""
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        if wide:
+            data = shm.buf[:width * height * 2].cast("H")
+        else:
+            data = shm.buf
+        if numpy is not None:
+            dtype = numpy.uint16 if wide else numpy.uint8
+            pixels = numpy.ndarray((height, width), dtype, buffer=data)
+        results = []
+        # The color selected by the band before, within this range
+        first = -1
+        for y in range(y0, y1, 6):
+            band = min(height - y, 6)
+            if optimize and numpy is not None:
+                results.append(encode_optimized_band(pixels[y:y + band],
+                                                     key_color, optimize, first))
+            elif optimize:
+                results.append(encode_optimized_band_python(
+                    data, width, y, band, key_color, optimize, first))
+            elif packed and numpy is not None:
+                results.append(encode_packed_band(pixels[y:y + band],
+                                                  key_color))
+            elif packed:
+                results.append(encode_packed_band_python(data, width, y, band,
+                                                         key_color))
+            elif numpy is not None:
+                results.append(encode_size_band(pixels[y:y + band]))
+            else:
+                results.append(encode_size_band_python(data, width, y, band))
+            if optimize >= 2 and results[-1][0]:
+                first = results[-1][0][-1]
+        if numpy is not None:
+            del pixels
+        del data
+        return results
+    finally:
+        shm.close()
+
+
+def iter_bands(indices, width, height, workers, packed=False, key_color=-1,
+               wide=False, optimize=0):
+    """Encodes the bands of a palette index buffer in a process pool.
+
+    ``indices`` holds one byte per pixel, or one native 16-bit integer per
+    pixel with ``wide`` (packed only), leaving room for a key color beyond
+    the palette.  It is copied once into shared memory, so workers read it
+    without pickling.  Yields the band results of
+    :func:`encode_packed_band` (``packed``), :func:`encode_optimized_band`
+    (``optimize`` level) or :func:`encode_size_band` in image order.
+    """
+    bands = (height + 5) // 6
+    step = max(1, -(-bands // (workers * RANGES_PER_WORKER))) * 6
+    shm = shared_memory.SharedMemory(create=True, size=max(1, len(indices)))
+    try:
+        shm.buf[:len(indices)] = indices
+        executor = ProcessPoolExecutor(max_workers=workers)
+        try:
+            futures = [executor.submit(_encode_range, shm.name, width, height,
+                                       y, min(y + step, height), packed,
+                                       key_color, wide, optimize)
+                       for y in range(0, height, step)]
+            for future in futures:
+                yield from future.result()
+        finally:
+            executor.shutdown(cancel_futures=True)
+    finally:
+        shm.close()
+        shm.unlink()
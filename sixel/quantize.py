@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+# Copyright 2012-2014 Hayaki Saito <user@zuse.jp>
+# Copyright 2023 Lubosz Sarnecki <lubosz@gmail.com>
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# Windows fixed fork by Simon Kalmi Claesson @sbamboo
+
+from functools import lru_cache
+
+from PIL import Image, ImageChops
+
+from .encoder import numpy
+
+# Palettes chosen per image
+ADAPTIVE_QUANTIZERS = {
+    "median-cut": Image.Quantize.MEDIANCUT,
+    "octree": Image.Quantize.FASTOCTREE,
+    "kmeans": Image.Quantize.MEDIANCUT,
+}
+# Palettes that do not depend on the image
+FIXED_PALETTES = ("xterm256", "websafe", "grayscale")
+QUANTIZERS = tuple(ADAPTIVE_QUANTIZERS) + FIXED_PALETTES
+DEFAULT_QUANTIZER = "median-cut"
+DITHERS = ("none", "bayer", "floyd-steinberg")
+
+# Pixels the k-means palette is chosen from, and its refinement passes
+KMEANS_SAMPLE = 128 * 128
+KMEANS_ITERATIONS = 6
+BAYER_SIZE = 8
+
+_XTERM_SYSTEM = (
+    (0, 0, 0), (128, 0, 0), (0, 128, 0), (128, 128, 0),
+    (0, 0, 128), (128, 0, 128), (0, 128, 128), (192, 192, 192),
+    (128, 128, 128), (255, 0, 0), (0, 255, 0), (255, 255, 0),
+    (0, 0, 255), (255, 0, 255), (0, 255, 255), (255, 255, 255),
+)
+
+
+def _xterm256():
+    levels = (0, 95, 135, 175, 215, 255)
+    colors = list(_XTERM_SYSTEM)
+    colors += [(r, g, b) for r in levels for g in levels for b in levels]
+    colors += [(8 + 10 * i,) * 3 for i in range(24)]
+    return colors
+
+
+def _websafe():
+    levels = range(0, 256, 51)
+    return [(r, g, b) for r in levels for g in levels for b in levels]
+
+
+def _grayscale(ncolor):
+    ncolor = max(2, ncolor)
+    return [(255 * i // (ncolor - 1),) * 3 for i in range(ncolor)]
+
+
+def _subset(colors, ncolor):
+    """Returns ncolor colors spread over a larger set of colors.
+
+    Starting from the darkest, every next color is the one farthest from
+    those already taken.
+    """
+    subset = [min(colors, key=sum)]
+    distances = [sum((a - b) ** 2 for a, b in zip(color, subset[0]))
+                 for color in colors]
+    while len(subset) < ncolor:
+        i = max(range(len(colors)), key=distances.__getitem__)
+        subset.append(colors[i])
+        distances = [min(d, sum((a - b) ** 2 for a, b in zip(color, colors[i])))
+                     for d, color in zip(distances, colors)]
+    return subset
+
+
+@lru_cache(maxsize=16)
+def fixed_palette(name, ncolor=256):
+    """Returns the palette image of a fixed palette.
+
+    The grayscale palette has ``ncolor`` levels.  When the xterm256 or
+    websafe palette has more colors than ``ncolor``, a subset of its
+    colors spread over the whole palette is used.
+    """
+    if name == "xterm256":
+        colors = _xterm256()
+    elif name == "websafe":
+        colors = _websafe()
+    elif name == "grayscale":
+        colors = _grayscale(min(ncolor, 256))
+    else:
+        raise ValueError("unknown palette %r" % name)
+    if len(colors) > ncolor:
+        colors = _subset(colors, ncolor)
+    palette = Image.new("P", (1, 1))
+    palette.putpalette([c for color in colors for c in color])
+    palette.info["quantizer"] = name
+    return palette
+
+
+def _sample(image, pixels):
+    """Returns ``image`` scaled down to about ``pixels`` pixels."""
+    width, height = image.size
+    if width * height <= pixels:
+        return image
+    scale = (pixels / (width * height)) ** 0.5
+    return image.resize((max(1, int(width * scale)), max(1, int(height * scale))),
+                        Image.Resampling.NEAREST)
+
+
+def _kmeans(sample, ncolor):
+    """Returns a palette image refined from a median cut of ``sample``."""
+    if numpy is None:
+        return sample.quantize(ncolor, Image.Quantize.MEDIANCUT,
+                               kmeans=KMEANS_ITERATIONS)
+    seed = sample.quantize(ncolor, Image.Quantize.MEDIANCUT)
+    centers = numpy.array(seed.getpalette(), numpy.float32).reshape(-1, 3)
+    pixels = numpy.asarray(sample, numpy.float32).reshape(-1, 3)
+    count = len(centers)
+    for _ in range(KMEANS_ITERATIONS):
+        # Squared distances up to the per-pixel constant |pixel|^2
+        distances = (centers * centers).sum(axis=1) - 2 * pixels @ centers.T
+        nearest = distances.argmin(axis=1)
+        sizes = numpy.bincount(nearest, minlength=count)
+        used = sizes > 0
+        for channel in range(3):
+            sums = numpy.bincount(nearest, pixels[:, channel], minlength=count)
+            centers[used, channel] = sums[used] / sizes[used]
+    palette = Image.new("P", (1, 1))
+    palette.putpalette(numpy.rint(centers).clip(0, 255).astype(numpy.uint8).tobytes())
+    return palette
+
+
+def choose_palette(image, ncolor=256, method=DEFAULT_QUANTIZER):
+    """Returns a palette image for an RGB image, to be used with :func:`remap`."""
+    if method in FIXED_PALETTES:
+        return fixed_palette(method, ncolor)
+    if method == "kmeans":
+        return _kmeans(_sample(image, KMEANS_SAMPLE), ncolor)
+    if method not in ADAPTIVE_QUANTIZERS:
+        raise ValueError("unknown quantizer %r" % method)
+    return image.quantize(ncolor, ADAPTIVE_QUANTIZERS[method])
+
+
+def _bayer_matrix(size):
+    if size == 1:
+        return [[0]]
+    half = _bayer_matrix(size // 2)
+    n = size // 2
+    return [[4 * half[y % n][x % n] + ((0, 2), (3, 1))[y // n][x // n]
+             for x in range(size)] for y in range(size)]
+
+
+def _spread(palette):
+    """Returns about the distance between neighbouring palette colors."""
+    ncolor = len(palette.getpalette()) // 3
+    if palette.info.get("quantizer") == "grayscale":
+        return 255 / max(1, ncolor - 1)
+    return 256 / max(1, round(ncolor ** (1 / 3)))
+
+
+def _bayer(image, spread, top=0):
+    """Adds an ordered dither threshold of +-spread/2 to an RGB image."""
+    size = BAYER_SIZE
+    width, height = image.size
+    tile = Image.new("L", (size, size))
+    tile.putdata([128 + int(((m + 0.5) / (size * size) - 0.5) * spread)
+                  for row in _bayer_matrix(size) for m in row])
+    # Tile the threshold map with a few pastes per row and column
+    row = Image.new("L", (width + size, size))
+    for x in range(0, width + size, size):
+        row.paste(tile, (x, 0))
+    bias = Image.new("L", (width + size, height + size))
+    for y in range(0, height + size, size):
+        bias.paste(row, (0, y))
+    bias = bias.crop((0, top % size, width, top % size + height))
+    return ImageChops.add(image, Image.merge("RGB", (bias,) * 3), 1.0, -128)
+
+
+def remap(image, palette, dither=None, top=0):
+    """Maps an RGB image to the colors of a palette image.
+
+    Pillow maps pixels through an RGB lookup table filled once per color
+    cell, so the cost does not grow with the palette.  ``top`` is the row
+    the image starts at within a larger one, keeping the ordered dither
+    pattern continuous across strips.
+    """
+    if dither not in (None,) + DITHERS:
+        raise ValueError("unknown dither %r" % dither)
+    if dither == "floyd-steinberg":
+        return image.quantize(palette=palette,
+                              dither=Image.Dither.FLOYDSTEINBERG)
+    if dither == "bayer":
+        image = _bayer(image, _spread(palette), top)
+    return image.quantize(palette=palette, dither=Image.Dither.NONE)
+
+
+def quantize(image, ncolor=256, method=DEFAULT_QUANTIZER, dither=None):
+    """Reduces an RGB image to a palette image of at most ncolor colors.
+
+    ``method`` is one of QUANTIZERS: a palette chosen for the image by
+    median cut, fast octree or k-means over a sample of its pixels, or a
+    fixed palette.  ``dither`` is one of DITHERS, none by default.
+    """
+    if method is None:
+        method = DEFAULT_QUANTIZER
+    if method in ADAPTIVE_QUANTIZERS and method != "kmeans" \
+            and dither in (None, "none"):
+        # The palette is chosen and mapped in one pass
+        return image.quantize(ncolor, ADAPTIVE_QUANTIZERS[method])
+    return remap(image, choose_palette(image, ncolor, method), dither)
@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+# Copyright 2012-2014 Hayaki Saito <user@zuse.jp>
+# Copyright 2023 Lubosz Sarnecki <lubosz@gmail.com>
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# Windows fixed fork by Simon Kalmi Claesson @sbamboo
+
+import os
+import platform
+
+
+def get_rcdir():
+    """Returns the per-user python-sixel directory."""
+    # Correctly determine home directory for cross-platform compatibility
+    if platform.system() == "Windows":
+        return os.path.join(os.getenv("APPDATA", os.path.expanduser("~")), ".pysixel")
+    return os.path.join(os.path.expanduser("~"), ".pysixel")
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+# Copyright 2012-2014 Hayaki Saito <user@zuse.jp>
+# Copyright 2023 Lubosz Sarnecki <lubosz@gmail.com>
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# Windows fixed fork by Simon Kalmi Claesson @sbamboo
+
+REGISTER_MODES = ("private", "shared", "auto")
+
+
+class ColorRegisters:
+    """Model of the color registers a terminal holds between images.
+
+    With ``shared`` the terminal keeps its registers from one image to the
+    next, so a register already holding a color is not defined again.
+    Otherwise, the default and what xterm does with private color
+    registers, every image defines all its colors and nothing is recorded.
+    """
+
+    def __init__(self, shared=False):
+        self.shared = shared
+        self.skipped = 0
+        self._colors = {}
+
+    @classmethod
+    def from_mode(cls, mode):
+        """Returns registers for one of REGISTER_MODES, probing for auto."""
+        if mode == "auto":
+            from .cellsize import get_private_registers
+
+            return cls(shared=get_private_registers() is False)
+        if mode not in REGISTER_MODES:
+            raise ValueError("unknown register mode %r" % mode)
+        return cls(shared=mode == "shared")
+
+    def invalidate(self):
+        """Forgets all registers, e.g. after the terminal was reset."""
+        self._colors.clear()
+
+    def define(self, n, r, g, b):
+        """Returns the definition of register n as a sixel RGB color.
+
+        The definition is empty when the register already holds the color.
+        """
+        rgb = (int(r), int(g), int(b))
+        if self.shared:
+            if self._colors.get(n) == rgb:
+                self.skipped += 1
+                return ''
+            self._colors[n] = rgb
+        return '#%d;2;%d;%d;%d' % ((n,) + rgb)
+
+
+# Registers of terminals that reset them per image, recording nothing
+PRIVATE_REGISTERS = ColorRegisters()
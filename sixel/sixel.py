@@ -6,54 +6,173 @@
 #
 # Windows fixed fork by Simon Kalmi Claesson @sbamboo
 
-import sys
-import os
-from .converter import SixelConverter
+from io import BytesIO
+
+from .cache import cache_key
+from .output import (ABORT_TIMEOUT, ChunkedWriter, isatty, stdout, write_bytes,
+                     write_str)
+from .registers import ColorRegisters
+from .stats import NULL_STATS
 
 
 class SixelWriter:
+    """Draws images to a terminal.
+
+    ``registers`` is the :class:`~sixel.registers.ColorRegisters` model of
+    the terminal, shared by every image drawn; by default the terminal is
+    assumed to reset its registers per image.  ``capabilities``, from
+    :func:`sixel.cellsize.get_capabilities`, caps the colors and size of
+    every image drawn to what the terminal shows and, without
+    ``registers``, tells whether it keeps its registers.
+    """
 
-    def __init__(self, f8bit=False, body_only=False):
+    def __init__(self, f8bit=False, body_only=False, registers=None,
+                 capabilities=None):
         self.f8bit = f8bit
         self._body_only = body_only
+        self.capabilities = capabilities
+        if registers is None:
+            shared = capabilities is not None \
+                and capabilities.private_registers is False
+            registers = ColorRegisters(shared=shared)
+        self.registers = registers
         if f8bit:  # 8bit mode
             self.CSI = '\x9b'
+            self.ST = '\x9c'
         else:
             self.CSI = '\x1b['
+            self.ST = '\x1b\\'
+
+    def capped(self, ncolor, max_size):
+        """Returns ncolor and max_size limited by the terminal's capabilities."""
+        capabilities = self.capabilities
+        if capabilities is None:
+            return ncolor, max_size
+        if capabilities.colors:
+            ncolor = min(ncolor, capabilities.colors)
+        if max_size is None:
+            max_size = capabilities.max_size
+        return ncolor, max_size
+
+    def invalidate_registers(self):
+        """Forgets the colors the terminal holds, e.g. after a reset."""
+        self.registers.invalidate()
 
     def save_position(self, output):
         if not self._body_only:
-            if os.isatty(output.fileno()):
-                output.write('\x1b7')  # DECSC
+            if isatty(output):
+                write_str(output, '\x1b7')  # DECSC
 
     def restore_position(self, output):
         if not self._body_only:
-            if os.isatty(output.fileno()):
-                output.write('\x1b8')  # DECRC
+            if isatty(output):
+                write_str(output, '\x1b8')  # DECRC
+
+    def abort(self, output, opened=True):
+        """Ends an interrupted image and restores the cursor position.
+
+        With ``opened`` the string terminator is written first, so the
+        terminal does not stay inside the sixel DCS.  The colors the
+        terminal holds are forgotten, as definitions may not have reached
+        it.  Errors are ignored, the output may be what failed.  A
+        :class:`ChunkedWriter` waits at most ABORT_TIMEOUT seconds for this.
+        """
+        self.registers.invalidate()
+        if self._body_only:
+            return
+        chunked = isinstance(output, ChunkedWriter)
+        if chunked:
+            timeout = output.timeout
+            output.timeout = ABORT_TIMEOUT if timeout is None \
+                else min(timeout, ABORT_TIMEOUT)
+        try:
+            if opened:
+                write_str(output, self.ST)
+            self.restore_position(output)
+            output.flush()
+        except (OSError, ValueError):
+            pass
+        finally:
+            if chunked:
+                output.timeout = timeout
 
     def move_x(self, n, fabsolute, output):
         if not self._body_only:
-            output.write(self.CSI)
+            write_str(output, self.CSI)
             if fabsolute:
-                output.write('%d`' % n)
+                write_str(output, '%d`' % n)
             elif n > 0:
-                output.write('%dC' % n)
+                write_str(output, '%dC' % n)
             elif n < 0:
-                output.write('%dD' % -n)
+                write_str(output, '%dD' % -n)
 
     def move_y(self, n, fabsolute, output):
         if not self._body_only:
-            output.write(self.CSI)
+            write_str(output, self.CSI)
             if fabsolute:
-                output.write('%dd' % n)
+                write_str(output, '%dd' % n)
             elif n > 0:
-                output.write('%dB' % n)
+                write_str(output, '%dB' % n)
             elif n < 0:
-                output.write('%dA' % n)
+                write_str(output, '%dA' % n)
+
+    def __encode_cached(self, filename, cache, w, h, ncolor,
+                        alpha_threshold, chromakey, fast, packed, workers,
+                        stats, resample, fit, quantizer, dither, optimize,
+                        max_size):
+        from .converter import SixelConverter
+
+        if hasattr(filename, "read"):
+            data = filename.read()
+        else:
+            with open(filename, "rb") as f:
+                data = f.read()
+        key = cache_key(data,
+                        f8bit=self.f8bit,
+                        body_only=self._body_only,
+                        w=w,
+                        h=h,
+                        ncolor=ncolor,
+                        alpha_threshold=alpha_threshold,
+                        chromakey=chromakey,
+                        fast=fast,
+                        packed=packed,
+                        resample=resample,
+                        fit=fit,
+                        quantizer=quantizer,
+                        dither=dither,
+                        optimize=optimize,
+                        max_size=max_size)
+        value = cache.get(key)
+        if value is None:
+            stats.count("cache_misses")
+            sixel_converter = SixelConverter(BytesIO(data),
+                                             self.f8bit,
+                                             w,
+                                             h,
+                                             ncolor,
+                                             alpha_threshold=alpha_threshold,
+                                             chromakey=chromakey,
+                                             fast=fast,
+                                             packed=packed,
+                                             workers=workers,
+                                             stats=stats,
+                                             resample=resample,
+                                             fit=fit,
+                                             quantizer=quantizer,
+                                             dither=dither,
+                                             optimize=optimize,
+                                             max_size=max_size)
+            value = sixel_converter.tobytes(body_only=self._body_only)
+            cache.put(key, value)
+        else:
+            stats.count("cache_hits")
+            stats.count("bytes", len(value))
+        return value
 
     def draw(self,
              filename,
-             output=sys.stdout,
+             output=None,
              absolute=False,
              x=None,
              y=None,
@@ -62,12 +181,158 @@ class SixelWriter:
              ncolor=256,
              alpha_threshold=0,
              chromakey=False,
-             fast=True):
+             fast=True,
+             packed=False,
+             workers=None,
+             stream=False,
+             bands=1,
+             cache=None,
+             stats=None,
+             resample=None,
+             fit=False,
+             max_memory=None,
+             quantizer=None,
+             dither=None,
+             optimize=0,
+             max_size=None):
+
+        # Pillow is only imported once there is something to draw
+        from .converter import SixelConverter, _as_image
+
+        if output is None:
+            output = stdout()
+        stats = stats or NULL_STATS
+        ncolor, max_size = self.capped(ncolor, max_size)
+        # Figures are rendered here, once
+        image = _as_image(filename)
+        if image is None:
+            # Rewind file objects, not the current frame of an image
+            try:
+                filename.seek(0)
+            except Exception:
+                pass
+        self.save_position(output)
+        opened = False
 
         try:
-            filename.seek(0)
-        except Exception:
-            pass
+            if x is not None:
+                self.move_x(x, absolute, output)
+
+            if y is not None:
+                self.move_y(y, absolute, output)
+
+            if image is not None:
+                # In-memory images are not cached, they change between draws
+                filename = image
+            elif cache is not None and max_memory is None \
+                    and not self.registers.shared:
+                # The cache holds whole files, strips are not cached, and
+                # output depending on the terminal's registers is not either
+                value = self.__encode_cached(filename, cache, w, h, ncolor,
+                                             alpha_threshold, chromakey, fast,
+                                             packed, workers, stats, resample,
+                                             fit, quantizer, dither, optimize,
+                                             max_size)
+                opened = True
+                with stats.stage("write"):
+                    write_bytes(output, value)
+                self.restore_position(output)
+                return
+
+            if max_memory is not None:
+                from .strips import SixelStripConverter
+                sixel_converter = SixelStripConverter(filename,
+                                                      self.f8bit,
+                                                      w,
+                                                      h,
+                                                      ncolor,
+                                                      alpha_threshold=alpha_threshold,
+                                                      chromakey=chromakey,
+                                                      stats=stats,
+                                                      resample=resample,
+                                                      fit=fit,
+                                                      max_memory=max_memory,
+                                                      quantizer=quantizer,
+                                                      dither=dither,
+                                                      registers=self.registers,
+                                                      max_size=max_size)
+            else:
+                sixel_converter = SixelConverter(filename,
+                                                 self.f8bit,
+                                                 w,
+                                                 h,
+                                                 ncolor,
+                                                 alpha_threshold=alpha_threshold,
+                                                 chromakey=chromakey,
+                                                 fast=fast,
+                                                 packed=packed,
+                                                 workers=workers,
+                                                 stats=stats,
+                                                 resample=resample,
+                                                 fit=fit,
+                                                 quantizer=quantizer,
+                                                 dither=dither,
+                                                 optimize=optimize,
+                                                 registers=self.registers,
+                                                 max_size=max_size)
+            opened = True
+            if stream:
+                for chunk in sixel_converter.iter_encode(self._body_only, bands):
+                    with stats.stage("write"):
+                        write_bytes(output, chunk)
+                        output.flush()
+            else:
+                sixel_converter.write(output, body_only=self._body_only)
+
+        except BaseException:
+            # Interrupted or timed out, possibly in the middle of the image
+            self.abort(output, opened)
+            raise
+        self.restore_position(output)
+
+    async def draw_async(self,
+                         filename,
+                         output,
+                         absolute=False,
+                         x=None,
+                         y=None,
+                         w=None,
+                         h=None,
+                         ncolor=256,
+                         alpha_threshold=0,
+                         chromakey=False,
+                         fast=True,
+                         packed=False,
+                         executor=None,
+                         bands=4,
+                         resample=None,
+                         fit=False,
+                         quantizer=None,
+                         dither=None,
+                         optimize=0,
+                         max_size=None):
+        """Draws to an asyncio stream writer or transport.
+
+        Decoding, quantization and encoding run in ``executor`` so the event
+        loop keeps serving other sessions; see :class:`AsyncSixelConverter`.
+        """
+        import asyncio
+
+        from .aio import AsyncSixelConverter, drain
+        from .converter import _as_image
+
+        ncolor, max_size = self.capped(ncolor, max_size)
+        # Rendering a figure would block the loop
+        image = await asyncio.get_running_loop().run_in_executor(
+            executor, _as_image, filename)
+        if image is None:
+            # Rewind file objects, not the current frame of an image
+            try:
+                filename.seek(0)
+            except Exception:
+                pass
+        else:
+            filename = image
         self.save_position(output)
 
         try:
@@ -77,15 +342,30 @@ class SixelWriter:
             if y is not None:
                 self.move_y(y, absolute, output)
 
-            sixel_converter = SixelConverter(filename,
-                                             self.f8bit,
-                                             w,
-                                             h,
-                                             ncolor,
-                                             alpha_threshold=alpha_threshold,
-                                             chromakey=chromakey,
-                                             fast=fast)
-            sixel_converter.write(output, body_only=self._body_only)
+            sixel_converter = await AsyncSixelConverter.create(
+                filename,
+                self.f8bit,
+                w,
+                h,
+                ncolor,
+                alpha_threshold=alpha_threshold,
+                chromakey=chromakey,
+                fast=fast,
+                packed=packed,
+                resample=resample,
+                fit=fit,
+                quantizer=quantizer,
+                dither=dither,
+                optimize=optimize,
+                registers=self.registers,
+                max_size=max_size,
+                executor=executor)
+            await sixel_converter.write(output, self._body_only, bands)
 
+        except BaseException:
+            # Cancelled or failed, definitions may not have reached it
+            self.registers.invalidate()
+            raise
         finally:
             self.restore_position(output)
+        await drain(output)
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+# Copyright 2012-2014 Hayaki Saito <user@zuse.jp>
+# Copyright 2023 Lubosz Sarnecki <lubosz@gmail.com>
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# Windows fixed fork by Simon Kalmi Claesson @sbamboo
+
+import json
+import time
+from contextlib import contextmanager
+
+
+class SixelStats:
+    """Wall and CPU time per render stage, plus counters.
+
+    Stages are ``open``, ``quantize``, ``resize``, ``palette``, ``encode``
+    and ``write``; counters include ``pixels``, ``colors``, ``runs``
+    (run-length repeats), ``bytes`` and ``cache_hits``.  ``callback`` is
+    called with the stage name, wall and CPU seconds whenever a stage
+    finishes, to feed external metrics.
+    """
+
+    enabled = True
+
+    def __init__(self, callback=None):
+        self.stages = {}
+        self.counters = {}
+        self._callback = callback
+
+    def add(self, name, wall, cpu):
+        """Adds time to a stage."""
+        stage = self.stages.setdefault(name, [0.0, 0.0, 0])
+        stage[0] += wall
+        stage[1] += cpu
+        stage[2] += 1
+        if self._callback is not None:
+            self._callback(name, wall, cpu)
+
+    @contextmanager
+    def stage(self, name):
+        """Times the enclosed block as a stage."""
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - wall, time.process_time() - cpu)
+
+    def iter_stage(self, name, iterable):
+        """Yields from an iterable, timing only the time spent producing."""
+        iterator = iter(iterable)
+        while True:
+            wall = time.perf_counter()
+            cpu = time.process_time()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add(name, time.perf_counter() - wall, time.process_time() - cpu)
+                return
+            self.add(name, time.perf_counter() - wall, time.process_time() - cpu)
+            yield item
+
+    def count(self, name, n=1):
+        """Adds to a counter."""
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def as_dict(self):
+        stages = {}
+        for name, (wall, cpu, calls) in self.stages.items():
+            stages[name] = {"wall_s": wall, "cpu_s": cpu, "calls": calls}
+        return {"stages": stages, "counters": dict(self.counters)}
+
+    def to_json(self):
+        return json.dumps(self.as_dict(), indent=1)
+
+    def format(self):
+        lines = ["%-10s %10s %10s" % ("stage", "wall ms", "cpu ms")]
+        for name, (wall, cpu, calls) in self.stages.items():
+            lines.append("%-10s %10.2f %10.2f" % (name, wall * 1000, cpu * 1000))
+        for name, value in self.counters.items():
+            lines.append("%-10s %10d" % (name, value))
+        return "\n".join(lines)
+
+
+class NullStats:
+    """Stats object that records nothing, the default."""
+
+    enabled = False
+
+    def add(self, name, wall, cpu):
+        pass
+
+    @contextmanager
+    def stage(self, name):
+        yield
+
+    def iter_stage(self, name, iterable):
+        return iterable
+
+    def count(self, name, n=1):
+        pass
+
+
+NULL_STATS = NullStats()
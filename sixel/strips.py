@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+# Copyright 2012-2014 Hayaki Saito <user@zuse.jp>
+# Copyright 2023 Lubosz Sarnecki <lubosz@gmail.com>
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# Windows fixed fork by Simon Kalmi Claesson @sbamboo
+
+import math
+
+from PIL import Image
+
+from .converter import (DEFAULT_RESAMPLE, TRANSPARENT, _as_image,
+                        _resample_filter, _target_size)
+from .encoder import numpy, encode_packed_band, encode_packed_band_python
+from .output import SixelEncoding
+from .quantize import (DEFAULT_QUANTIZER, FIXED_PALETTES, choose_palette,
+                       fixed_palette, remap)
+from .registers import PRIVATE_REGISTERS
+from .stats import NULL_STATS
+
+DEFAULT_MAX_MEMORY = 64 * 1024 * 1024
+# Rows read, evenly spread over the image, to choose the palette
+PALETTE_SAMPLE_ROWS = 256
+# Width the sampled rows are scaled to
+PALETTE_SAMPLE_WIDTH = 512
+
+# Bytes per pixel of the raw modes that can be read strip by strip
+_RAW_MODES = {"L": 1, "RGB": 3, "BGR": 3, "RGBA": 4, "BGRA": 4, "RGBX": 4}
+
+
+class _RawRows:
+    """Reads rows of an uncompressed image straight from its file."""
+
+    def __init__(self, image):
+        self.mode = image.mode
+        self.width = image.width
+        self._fp = image.fp
+        self._tiles = []
+        if not image.tile:
+            raise ValueError("image is not backed by a file")
+        for tile in image.tile:
+            name, extents, offset, args = tile
+            if isinstance(args, str):
+                args = (args,)
+            rawmode = args[0]
+            stride = args[1] if len(args) > 1 else 0
+            orientation = args[2] if len(args) > 2 else 1
+            x0, y0, x1, y1 = extents
+            if name != "raw" or (x0, x1) != (0, self.width) \
+                    or rawmode not in _RAW_MODES:
+                raise ValueError("not a raw image")
+            if not stride:
+                stride = self.width * _RAW_MODES[rawmode]
+            self._tiles.append((y0, y1, offset, rawmode, stride, orientation))
+
+    def read(self, y0, y1):
+        """Returns rows y0 to y1 as an image."""
+        rows = Image.new(self.mode, (self.width, y1 - y0))
+        for ty0, ty1, offset, rawmode, stride, orientation in self._tiles:
+            a, b = max(y0, ty0), min(y1, ty1)
+            if a >= b:
+                continue
+            if orientation < 0:
+                # Stored bottom-up
+                self._fp.seek(offset + (ty1 - b) * stride)
+            else:
+                self._fp.seek(offset + (a - ty0) * stride)
+            data = self._fp.read((b - a) * stride)
+            part = Image.frombuffer(self.mode, (self.width, b - a), data,
+                                    "raw", rawmode, stride, orientation)
+            rows.paste(part, (0, a - y0))
+        return rows
+
+
+class _DecodedRows:
+    """Reads rows of an image that has to be decoded as a whole."""
+
+    def __init__(self, image):
+        self.mode = image.mode
+        self.width = image.width
+        self._image = image
+
+    def read(self, y0, y1):
+        return self._image.crop((0, y0, self.width, y1))
+
+
+class SixelStripConverter(SixelEncoding):
+    """Encodes an image strip by strip in bounded memory.
+
+    The image is scaled, quantized and encoded in horizontal strips of a
+    multiple of 6 rows, sized to stay within ``max_memory`` bytes, and each
+    strip is written out before the next one is read.  Uncompressed images
+    (PPM, BMP, TIFF) are read strip by strip from the file; other formats
+    are decoded once, after which strips still bound the memory of all
+    later stages.  The palette is chosen from rows sampled over the whole
+    image, and the packed encoder is always used.
+
+    Takes the same image and options as :class:`SixelConverter`.
+    """
+
+    def __init__(self, file,
+                 f8bit=False,
+                 w=None,
+                 h=None,
+                 ncolor=256,
+                 alpha_threshold=0,
+                 chromakey=False,
+                 stats=None,
+                 resample=DEFAULT_RESAMPLE,
+                 fit=False,
+                 max_memory=DEFAULT_MAX_MEMORY,
+                 quantizer=DEFAULT_QUANTIZER,
+                 dither=None,
+                 registers=None,
+                 max_size=None):
+
+        self.__alpha_threshold = alpha_threshold
+        self.__chromakey = chromakey
+        self._quantizer = quantizer or DEFAULT_QUANTIZER
+        self._dither = dither
+        self._registers = registers if registers is not None else PRIVATE_REGISTERS
+        self._slots = [0] * 257
+        self._stats = stats = stats or NULL_STATS
+
+        if ncolor >= 256:
+            ncolor = 256
+
+        if f8bit:  # 8bit mode
+            self.DCS = '\x90'
+            self.ST = '\x9c'
+        else:
+            self.DCS = '\x1bP'
+            self.ST = '\x1b\\'
+
+        self._resample = _resample_filter(resample)
+
+        with stats.stage("open"):
+            image = _as_image(file)
+            if image is None:
+                image = Image.open(file)
+            self._source_size = image.size
+            self.width, self.height = _target_size(image.size, w, h, fit, max_size)
+            self._mode = "RGBA" if alpha_threshold > 0 else "RGB"
+            try:
+                self._rows = _RawRows(image)
+            except (AttributeError, ValueError):
+                if self.width < image.width and self.height < image.height:
+                    image.draft(self._mode, (self.width, self.height))
+                self._source_size = image.size
+                self._rows = _DecodedRows(image)
+
+        source_width, source_height = self._source_size
+        self._scale = source_height / self.height
+        # Bytes held per output row: the source rows it is scaled from, in
+        # the file's and the working mode, plus the indices and the band
+        row_bytes = (math.ceil(self._scale) * source_width * 8
+                     + self.width * 8)
+        self._strip_rows = max(6, max_memory // row_bytes // 6 * 6)
+
+        with stats.stage("quantize"):
+            self._palette_image = self.__sample_palette(ncolor)
+        self.palette = self._palette_image.getpalette()
+        if stats.enabled:
+            stats.count("pixels", self.width * self.height)
+
+    def __sample_palette(self, ncolor):
+        if self._quantizer in FIXED_PALETTES:
+            return fixed_palette(self._quantizer, ncolor)
+        source_width, source_height = self._source_size
+        count = min(PALETTE_SAMPLE_ROWS, source_height)
+        sample_width = min(PALETTE_SAMPLE_WIDTH, source_width)
+        sheet = Image.new("RGB", (sample_width, count))
+        for i in range(count):
+            y = i * source_height // count
+            row = self._rows.read(y, y + 1).convert("RGB")
+            sheet.paste(row.resize((sample_width, 1)), (0, i))
+        return choose_palette(sheet, ncolor, self._quantizer)
+
+    def __read_strip(self, y0, y1):
+        """Returns output rows y0 to y1 in the working mode."""
+        stats = self._stats
+        source_width, source_height = self._source_size
+        if (self.width, self.height) == self._source_size:
+            with stats.stage("open"):
+                return self._rows.read(y0, y1).convert(self._mode)
+
+        # Read a margin around the source rows, for the filter support
+        top = y0 * self._scale
+        bottom = y1 * self._scale
+        margin = math.ceil(max(1, self._scale) * 3) + 1
+        r0 = max(0, int(top) - margin)
+        r1 = min(source_height, math.ceil(bottom) + margin)
+        with stats.stage("open"):
+            rows = self._rows.read(r0, r1).convert(self._mode)
+        with stats.stage("resize"):
+            return rows.resize((self.width, y1 - y0), self._resample,
+                               box=(0, top - r0, source_width, bottom - r0))
+
+    def __iter_strip_bands(self, strip, top):
+        stats = self._stats
+        width = self.width
+        with stats.stage("quantize"):
+            quantized = remap(strip.convert("RGB"), self._palette_image,
+                              self._dither, top)
+        if self.__chromakey and self._key_color == -1:
+            self._key_color = quantized.getpixel((0, 0))
+        key_color = self._key_color
+        if numpy is not None:
+            indices = numpy.asarray(quantized)
+        else:
+            indices = quantized.tobytes()
+        if self.__alpha_threshold > 0:
+            alpha = strip.getchannel("A").tobytes()
+            threshold = self.__alpha_threshold
+            if numpy is not None:
+                indices = indices.astype(numpy.uint16)
+                skipped = numpy.frombuffer(alpha, numpy.uint8).reshape(
+                    indices.shape) < threshold
+                if key_color != -1:
+                    skipped |= indices == key_color
+                indices[skipped] = TRANSPARENT
+            else:
+                indices = [TRANSPARENT if a < threshold or c == key_color else c
+                           for c, a in zip(indices, alpha)]
+            key_color = TRANSPARENT
+
+        height = strip.height
+        for y in range(0, height, 6):
+            band = min(height - y, 6)
+            with stats.stage("encode"):
+                if numpy is not None:
+                    yield encode_packed_band(indices[y:y + band], key_color)
+                else:
+                    yield encode_packed_band_python(indices, width, y, band,
+                                                    key_color)
+
+    def __iter_body(self):
+        palette = self.palette
+        self._key_color = -1
+        for y0 in range(0, self.height, self._strip_rows):
+            y1 = min(self.height, y0 + self._strip_rows)
+            strip = self.__read_strip(y0, y1)
+            for colors, body in self.__iter_strip_bands(strip, y0):
+                out = []
+                for n in colors:
+                    if self._slots[n] == 0:
+                        r = palette[n * 3 + 0] * 100 / 256
+                        g = palette[n * 3 + 1] * 100 / 256
+                        b = palette[n * 3 + 2] * 100 / 256
+                        self._slots[n] = 1
+                        out.append(self._registers.define(n, r, g, b))
+                out.append(body)
+                yield ''.join(out)
+            del strip
+
+    def _iter_sections(self, body_only):
+        self._slots = [0] * 257
+        if not body_only:
+            background_option = 2 if self.__chromakey else 1
+            yield self.DCS + '7;%d;75q"1;1;%d;%d' % (background_option,
+                                                     self.width, self.height)
+        body = self.__iter_body()
+        if self._stats.enabled:
+            for band in body:
+                self._stats.count("runs", band.count('!'))
+                yield band
+        else:
+            yield from body
+        if not body_only:
+            yield self.ST  # terminate Device Control String
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import random
+import threading
+
+import pytest
+from PIL import Image, ImageDraw
+
+import sixel.converter
+
+
+def _picture(width, height, seed=7):
+    image = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    draw = ImageDraw.Draw(image)
+    rng = random.Random(seed)
+    for _ in range(12):
+        x, y = rng.randrange(width), rng.randrange(height)
+        draw.ellipse((x, y, x + rng.randrange(4, 40), y + rng.randrange(4, 40)),
+                     fill=tuple(rng.randrange(256) for _ in range(3)))
+    return image
+
+
+@pytest.fixture
+def without_numpy(monkeypatch):
+    monkeypatch.setattr(sixel.converter, "numpy", None)
+
+
+@pytest.fixture
+def picture():
+    """A gradient with colored shapes, 61 x 47 so bands and runs are uneven."""
+    return _picture(61, 47)
+
+
+@pytest.fixture
+def tall_picture():
+    """A picture tall enough to be encoded in parallel."""
+    return _picture(40, 200)
+
+
+class StubFigure:
+    """A Matplotlib figure stand-in recording where its canvas is drawn."""
+
+    def __init__(self, picture):
+        numpy = pytest.importorskip("numpy")
+        self.canvas = self
+        self.threads = []
+        self._buffer = numpy.asarray(picture.convert("RGBA"))
+
+    def draw(self):
+        self.threads.append(threading.current_thread())
+
+    def buffer_rgba(self):
+        return self._buffer
+
+    def savefig(self, *args, **kwargs):
+        raise NotImplementedError
+
+
+@pytest.fixture
+def figure(picture):
+    return StubFigure(picture)
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""A minimal sixel decoder to check what encoders paint."""
+
+ST = "\x1b\\"
+
+
+def decode(data):
+    """Returns the width, height and rows of a sixel image.
+
+    Every pixel is the (r, g, b) percentage of its color register, or None
+    where nothing was painted.
+    """
+    if isinstance(data, bytes):
+        data = data.decode("latin-1")
+    i = data.index("q") + 1
+    end = data.index(ST, i)
+    width = height = 0
+    if data[i] == '"':
+        j = i + 1
+        while data[j].isdigit() or data[j] == ";":
+            j += 1
+        width, height = [int(v) for v in data[i + 1:j].split(";")[2:4]]
+        i = j
+    rows = [[None] * width for _ in range(height)]
+    registers = {}
+    color = 0
+    x = y = 0
+    while i < end:
+        c = data[i]
+        if c == "#":
+            j = i + 1
+            while data[j].isdigit() or data[j] == ";":
+                j += 1
+            fields = [int(v) for v in data[i + 1:j].split(";")]
+            color = fields[0]
+            if len(fields) == 5:
+                registers[color] = tuple(fields[2:])
+            i = j
+            continue
+        if c == "$":
+            x = 0
+        elif c == "-":
+            x = 0
+            y += 6
+        elif c == "!" or "?" <= c <= "~":
+            count = 1
+            if c == "!":
+                j = i + 1
+                while data[j].isdigit():
+                    j += 1
+                count = int(data[i + 1:j])
+                i = j
+                c = data[i]
+            bits = ord(c) - 0x3F
+            for b in range(6):
+                if bits >> b & 1 and y + b < height:
+                    row = rows[y + b]
+                    for px in range(x, min(x + count, width)):
+                        row[px] = registers[color]
+            x += count
+        i += 1
+    return width, height, rows
+
+
+def expected(converter, skipped=()):
+    """Returns the rows a converter's quantized image should decode to.
+
+    Pixels whose palette index is in ``skipped`` are None.
+    """
+    palette = converter.palette
+    data = list(converter.data)
+    width = converter.width
+    rows = []
+    for y in range(converter.height):
+        row = []
+        for n in data[y * width:(y + 1) * width]:
+            if n in skipped:
+                row.append(None)
+            else:
+                row.append(tuple(v * 100 // 256 for v in palette[n * 3:n * 3 + 3]))
+        rows.append(row)
+    return rows
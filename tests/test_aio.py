@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import asyncio
+import io
+import threading
+
+import pytest
+
+from sixel import ColorRegisters, SixelWriter
+from sixel.aio import AsyncSixelConverter, drain
+
+
+class FakeStreamWriter:
+    """Collects bytes like a StreamWriter, stalling in drain() if asked."""
+
+    def __init__(self, stall_after=None):
+        self.data = bytearray()
+        self.stall_after = stall_after
+        self.stalled = asyncio.Event()
+
+    def write(self, data):
+        assert isinstance(data, bytes)
+        self.data += data
+
+    async def drain(self):
+        if self.stall_after is not None and len(self.data) > self.stall_after:
+            self.stalled.set()
+            await asyncio.get_running_loop().create_future()
+
+
+class FakeTransport(asyncio.WriteTransport):
+    """A transport whose buffer the peer reads ``rate`` bytes at a time."""
+
+    def __init__(self, high=1024, rate=None):
+        super().__init__()
+        self.data = bytearray()
+        self.pending = 0
+        self.peak = 0
+        self.high = high
+        self.rate = rate
+        self.closing = False
+
+    def write(self, data):
+        self.data += data
+        self.pending += len(data)
+        self.peak = max(self.peak, self.pending)
+        if self.rate is None:
+            self.pending = 0
+        elif self.rate and self.pending == len(data):
+            asyncio.get_running_loop().call_soon(self._read)
+
+    def _read(self):
+        self.pending = max(0, self.pending - self.rate)
+        if self.pending:
+            asyncio.get_running_loop().call_soon(self._read)
+
+    def get_write_buffer_limits(self):
+        return 0, self.high
+
+    def get_write_buffer_size(self):
+        return self.pending
+
+    def is_closing(self):
+        return self.closing
+
+
+async def _cancel_stalled(writer, picture, output):
+    task = asyncio.ensure_future(writer.draw_async(picture, output,
+                                                   packed=True, bands=1))
+    await output.stalled.wait()
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        return
+    raise AssertionError("the draw was not cancelled")
+
+
+def _definitions(writer, picture):
+    output = io.BytesIO()
+    writer.draw(picture, output=output, packed=True)
+    return output.getvalue().count(b";2;")
+
+
+def test_cancelled_draw_forgets_registers(picture):
+    writer = SixelWriter(registers=ColorRegisters(shared=True))
+    asyncio.run(_cancel_stalled(writer, picture, FakeStreamWriter(100)))
+    fresh = SixelWriter(registers=ColorRegisters(shared=True))
+    assert _definitions(writer, picture) == _definitions(fresh, picture)
+
+
+def test_figure_is_rendered_once_off_the_loop(figure):
+    output = FakeStreamWriter()
+    asyncio.run(SixelWriter().draw_async(figure, output))
+    assert len(figure.threads) == 1
+    assert figure.threads[0] is not threading.main_thread()
+    assert output.data.startswith(b"\x1bP")
+
+
+@pytest.mark.parametrize("mode", [{}, {"packed": True}, {"optimize": 2}])
+def test_draw_async_writes_what_draw_writes(picture, mode):
+    output = FakeStreamWriter()
+    asyncio.run(SixelWriter().draw_async(picture, output, bands=1, **mode))
+    data = io.BytesIO()
+    SixelWriter().draw(picture, output=data, **mode)
+    assert bytes(output.data) == data.getvalue()
+
+
+def test_cancelled_draw_ends_the_image(picture):
+    output = FakeStreamWriter(100)
+    asyncio.run(_cancel_stalled(SixelWriter(), picture, output))
+    assert output.data.startswith(b"\x1bP")
+    assert output.data.endswith(b"\x1b\\")
+    assert output.data.count(b"\x1b\\") == 1
+
+
+def test_body_only_has_no_terminator(picture):
+    async def encode():
+        converter = await AsyncSixelConverter.create(picture, packed=True)
+        output = FakeStreamWriter()
+        await converter.write(output, body_only=True)
+        return output.data
+
+    data = asyncio.run(encode())
+    assert not data.startswith(b"\x1bP")
+    assert not data.endswith(b"\x1b\\")
+
+
+def test_transport_is_drained_between_chunks(picture):
+    transport = FakeTransport(high=256, rate=64)
+    asyncio.run(SixelWriter().draw_async(picture, transport, x=2, y=3,
+                                         bands=1, packed=True))
+    data = io.BytesIO()
+    SixelWriter().draw(picture, output=data, packed=True)
+    assert transport.data.endswith(data.getvalue())
+    assert transport.data.startswith(b"\x1b[")
+    # One band is written at a time, past the limit only by that band
+    assert transport.peak < 256 + len(data.getvalue()) // 4
+    assert transport.pending == 0
+
+
+def test_drain_waits_for_the_transport():
+    async def wait():
+        transport = FakeTransport(high=10, rate=4)
+        transport.write(b"x" * 40)
+        await drain(transport)
+        return transport.pending
+
+    assert asyncio.run(wait()) <= 10
+
+
+def test_drain_returns_when_the_transport_closes():
+    async def wait():
+        transport = FakeTransport(high=10, rate=0)
+        transport.write(b"x" * 40)
+        asyncio.get_running_loop().call_later(0.05, setattr, transport,
+                                              "closing", True)
+        await asyncio.wait_for(drain(transport), 5)
+        return transport.pending
+
+    assert asyncio.run(wait()) == 40
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import pytest
+from PIL import Image
+
+from sixel.converter import SixelConverter
+
+from decoder import decode, expected
+
+
+@pytest.mark.parametrize("mode", [{"fast": True}, {"fast": False},
+                                  {"packed": True}, {"optimize": 3}])
+def test_alpha_threshold(picture, mode):
+    image = picture.convert("RGBA")
+    image.putalpha(Image.linear_gradient("L").resize(picture.size))
+    converter = SixelConverter(image, alpha_threshold=128, **mode)
+    rows = decode(converter.tobytes())[2]
+    alpha = image.getchannel("A").tobytes()
+    want = expected(converter)
+    for y, row in enumerate(want):
+        for x in range(len(row)):
+            if alpha[y * image.width + x] < 128:
+                row[x] = None
+    assert rows == want
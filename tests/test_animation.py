@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from PIL import Image
+
+from sixel.animation import SixelAnimation
+
+from decoder import decode
+
+
+def test_frames_fit_within_max_size(tmp_path, picture):
+    path = tmp_path / "animation.gif"
+    frames = [picture, picture.rotate(180)]
+    frames[0].save(path, save_all=True, append_images=frames[1:], duration=50)
+    animation = SixelAnimation(str(path), ncolor=8, max_size=(30, 30))
+    sizes = [decode(sixel)[:2] for top, sixel, duration
+             in animation.iter_frames() if sixel is not None]
+    assert sizes[0] == (30, 23)
+    assert len(animation.palette) <= 8 * 3
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import multiprocessing
+import os
+import sys
+
+import pytest
+
+import sixel.batch
+from sixel.batch import convert_file, convert_many
+
+
+def _crash_on_bomb(path, output, **options):
+    if path.endswith("bomb.png"):
+        os._exit(1)
+    return convert_file(path, output, **options)
+
+
+@pytest.fixture
+def images(tmp_path, picture):
+    paths = []
+    for i in range(12):
+        path = tmp_path / ("image%d.png" % i)
+        picture.save(path)
+        paths.append(str(path))
+    return paths
+
+
+@pytest.mark.skipif(sys.platform == "win32" or os.getuid() == 0,
+                    reason="needs permissions that apply")
+def test_unwritable_output_reports_the_real_error(tmp_path, images):
+    output_dir = tmp_path / "out"
+    output_dir.mkdir(mode=0o500)
+    result = convert_file(images[0], str(output_dir / "a.six"))
+    assert result.error.startswith("PermissionError")
+
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != "fork",
+                    reason="workers need the patched module")
+def test_worker_crash_does_not_end_the_batch(tmp_path, images, monkeypatch):
+    bomb = tmp_path / "bomb.png"
+    bomb.write_bytes(b"")
+    monkeypatch.setattr(sixel.batch, "convert_file", _crash_on_bomb)
+    paths = images[:3] + [str(bomb)] + images[3:]
+    results = list(convert_many(paths, str(tmp_path / "out"), jobs=2))
+    assert len(results) == len(paths)
+    assert [r.path for r in results if not r.ok] == [str(bomb)]
+    assert sorted(r.path for r in results if r.ok) == sorted(images)
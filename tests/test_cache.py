@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import io
+import os
+
+import pytest
+
+from sixel import ColorRegisters, SixelWriter
+from sixel.cache import MemoryCache, SixelCache
+
+BASE = {"w": 40, "h": 30}
+# One changed value for every output parameter of draw()
+CHANGED = [
+    ("w", 20),
+    ("h", 20),
+    ("ncolor", 16),
+    ("alpha_threshold", 128),
+    ("chromakey", True),
+    ("fast", False),
+    ("packed", True),
+    ("resample", "nearest"),
+    ("fit", True),
+    ("quantizer", "octree"),
+    ("dither", "none"),
+    ("optimize", 1),
+    ("max_size", (20, 20)),
+]
+
+
+@pytest.fixture
+def image_file(picture, tmp_path):
+    path = tmp_path / "picture.png"
+    picture.save(path)
+    return str(path)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return SixelCache(str(tmp_path / "cache"))
+
+
+def _draw(writer, source, **options):
+    output = io.BytesIO()
+    writer.draw(source, output=output, **options)
+    return output.getvalue()
+
+
+@pytest.mark.parametrize("name, value", CHANGED)
+def test_every_output_parameter_is_in_the_key(image_file, cache, name, value):
+    _draw(SixelWriter(), image_file, cache=cache, **BASE)
+    options = dict(BASE, **{name: value})
+    data = _draw(SixelWriter(), image_file, cache=cache, **options)
+    assert (cache.hits, cache.misses) == (0, 2)
+    assert data == _draw(SixelWriter(), image_file, **options)
+
+
+@pytest.mark.parametrize("writer", [{"f8bit": True}, {"body_only": True}])
+def test_writer_options_are_in_the_key(image_file, cache, writer):
+    _draw(SixelWriter(), image_file, cache=cache)
+    _draw(SixelWriter(**writer), image_file, cache=cache)
+    assert (cache.hits, cache.misses) == (0, 2)
+
+
+def test_hit_writes_the_cached_output(image_file, cache):
+    first = _draw(SixelWriter(), image_file, cache=cache)
+    with open(image_file, "rb") as f:
+        second = _draw(SixelWriter(), f, cache=cache)
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert first == second == _draw(SixelWriter(), image_file)
+
+
+def test_uncached_sources(picture, image_file, cache):
+    _draw(SixelWriter(), picture, cache=cache)
+    _draw(SixelWriter(), image_file, cache=cache, max_memory=1)
+    shared = SixelWriter(registers=ColorRegisters(shared=True))
+    _draw(shared, image_file, cache=cache)
+    assert (cache.hits, cache.misses) == (0, 0)
+    assert not os.path.exists(cache.directory)
+
+
+def _age(cache, key, seconds_ago):
+    path = os.path.join(cache.directory, key + ".six")
+    when = os.stat(path).st_mtime - seconds_ago
+    os.utime(path, (when, when))
+
+
+def test_evicts_least_recently_used(cache):
+    cache.max_size = 250
+    for i, key in enumerate("ab"):
+        cache.put(key, b"x" * 100)
+        _age(cache, key, 100 - i * 10)
+    # Reading "a" makes it the most recently used entry
+    assert cache.get("a") == b"x" * 100
+    cache.put("c", b"x" * 100)
+    assert cache.get("b") is None
+    assert cache.get("a") == b"x" * 100
+    assert cache.get("c") == b"x" * 100
+
+
+def test_evicts_until_it_fits(cache):
+    cache.max_size = 250
+    for i, key in enumerate("abcd"):
+        cache.put(key, b"x" * 100)
+        _age(cache, key, 100 - i * 10)
+    cache.evict()
+    assert [cache.get(key) is not None for key in "abcd"] \
+        == [False, False, True, True]
+
+
+def test_failed_put_leaves_nothing(cache, monkeypatch):
+    cache.put("key", b"old")
+
+    def fail(src, dst):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(os, "replace", fail)
+    with pytest.raises(OSError):
+        cache.put("key", b"new")
+    assert sorted(os.listdir(cache.directory)) == ["key.six"]
+    assert cache.get("key") == b"old"
+
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = MemoryCache(max_size=250)
+    for key in "abc":
+        cache.put(key, b"x" * 100)
+    assert cache.get("a") is None
+    assert cache.get("b") is not None
+    cache.put("d", b"x" * 100)
+    assert cache.get("c") is None
+    assert cache.size == 200
+    cache.put("big", b"x" * 300)
+    assert cache.get("big") is None
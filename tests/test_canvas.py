@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from PIL import Image, ImageDraw
+
+from sixel.canvas import SixelCanvas
+
+from decoder import decode
+
+
+def _show(screen, sixel, top):
+    """Paints a sixel onto a screen of rows, ``top`` rows down."""
+    width, height, rows = decode(sixel)
+    for y, row in enumerate(rows):
+        for x, pixel in enumerate(row):
+            if pixel is not None:
+                screen[top + y][x] = pixel
+
+
+def test_new_colors_are_not_left_wrong():
+    frame = Image.linear_gradient("L").resize((120, 96)).convert("RGB")
+    canvas = SixelCanvas()
+    screen = [[None] * 120 for _ in range(96)]
+    _show(screen, *reversed(canvas.encode(frame)))
+
+    # A small red square, a color the gray palette cannot show
+    frame = frame.copy()
+    ImageDraw.Draw(frame).rectangle((10, 10, 29, 29), fill=(255, 0, 0))
+    top, sixel = canvas.encode(frame)
+    _show(screen, sixel, top)
+    r, g, b = screen[20][20]
+    assert r > 90 and g < 10 and b < 10
+    assert canvas.full_refreshes == 2
+
+
+def test_unchanged_frame_sends_nothing():
+    frame = Image.linear_gradient("L").resize((64, 32)).convert("RGB")
+    canvas = SixelCanvas()
+    canvas.encode(frame)
+    assert canvas.encode(frame) == (0, None)
+    assert canvas.full_refreshes == 1
+
+
+def test_frames_are_scaled_like_the_converter(picture):
+    canvas = SixelCanvas(w=30, h=30, fit=True, resample="nearest")
+    top, sixel = canvas.encode(picture)
+    assert decode(sixel)[:2] == (30, 23)
+
+
+def test_capabilities_of_the_writer_cap_frames(picture):
+    from sixel import SixelWriter
+    from sixel.cellsize import TerminalCapabilities
+
+    capabilities = TerminalCapabilities(colors=8, max_width=30, max_height=30)
+    canvas = SixelCanvas(writer=SixelWriter(capabilities=capabilities))
+    top, sixel = canvas.encode(picture)
+    width, height, rows = decode(sixel)
+    assert (width, height) == (30, 23)
+    assert len(set(pixel for row in rows for pixel in row)) <= 8
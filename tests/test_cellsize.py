@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import pytest
+
+import sixel.cellsize
+from sixel import SixelWriter
+from sixel.cellsize import _REPORT, TerminalCapabilities
+
+parse_capabilities = getattr(sixel.cellsize, "__parse_capabilities")
+
+XTERM = ("\x1b[?1;0;256S\x1b[?2;0;1000;1000S\x1b[4;480;800t"
+         "\x1b[8;24;80t\x1b[?1070;1$y\x1b[?63;1;2;4;6;9;15;22c")
+
+REPLIES = [
+    (XTERM, {"colors": 256, "max_width": 1000, "max_height": 1000,
+             "height": 480, "width": 800, "rows": 24, "columns": 80,
+             "private_registers": True, "sixel": True}),
+    # Only DA1, from a terminal ignoring the other queries
+    ("\x1b[?62;22c", {"sixel": False}),
+    # The device class is not a feature
+    ("\x1b[?4;22c", {"sixel": False}),
+    # XTSMGRAPHICS errors and a geometry without height
+    ("\x1b[?1;3;0S\x1b[?2;0;640S\x1b[?62;4c", {"sixel": True}),
+    ("\x1b[?2;1;0S\x1b[?1;0;16S", {"colors": 16}),
+    # DECRPM of a mode unknown to the terminal, and reset
+    ("\x1b[?1070;0$y", {"private_registers": None}),
+    ("\x1b[?1070;2$y", {"private_registers": False}),
+    ("\x1b[?1070;4$y", {"private_registers": False}),
+    # Other modes, window sizes and cut off replies are ignored
+    ("\x1b[?25;1$y\x1b[3;10;10t\x1b[?1;0;2", {}),
+    ("", {}),
+]
+
+
+@pytest.mark.parametrize("reply, fields", REPLIES)
+def test_parse_capabilities(reply, fields):
+    assert parse_capabilities(_REPORT.findall(reply)) == fields
+
+
+def test_report_ignores_other_input():
+    reports = _REPORT.findall("typed\x1b[?1;0;64Skeys\x1b[8;1;2t")
+    assert reports == [("?", "1;0;64", "S"), ("", "8;1;2", "t")]
+
+
+def test_sizes_need_both_dimensions():
+    capabilities = TerminalCapabilities(max_width=640, width=800, rows=24)
+    assert capabilities.max_size is None
+    assert capabilities.cell_size is None
+    capabilities = TerminalCapabilities(width=800, height=480, rows=24,
+                                        columns=80)
+    assert capabilities.cell_size == (10, 20)
+
+
+def test_writer_caps_to_the_terminal():
+    writer = SixelWriter(capabilities=TerminalCapabilities(
+        colors=16, max_width=640, max_height=480))
+    assert writer.capped(256, None) == (16, (640, 480))
+    assert writer.capped(8, (100, 100)) == (8, (100, 100))
+    assert SixelWriter().capped(256, None) == (256, None)
+    assert SixelWriter(capabilities=TerminalCapabilities()).capped(
+        256, None) == (256, None)
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import io
+import os
+import stat
+import sys
+import threading
+
+import pytest
+
+import sixel.converter
+from sixel.daemon import SixelClient, SixelDaemon
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32",
+                                reason="needs Unix sockets")
+
+
+@pytest.fixture
+def daemon(tmp_path):
+    daemon = SixelDaemon(str(tmp_path / "daemon.sock"), idle_timeout=0.5)
+    thread = threading.Thread(target=daemon.serve)
+    thread.start()
+    yield daemon
+    thread.join()
+
+
+def _png(picture):
+    data = io.BytesIO()
+    picture.save(data, "PNG")
+    data.seek(0)
+    return data
+
+
+def test_socket_is_private(daemon):
+    assert stat.S_IMODE(os.stat(daemon.path).st_mode) & 0o077 == 0
+
+
+def test_render(daemon, picture):
+    output = io.BytesIO()
+    SixelClient(daemon.path).request(_png(picture), output)
+    assert output.getvalue().startswith(b"\x1bP")
+    assert output.getvalue().endswith(b"\x1b\\")
+
+
+def test_encode_error_ends_the_image(daemon, picture, monkeypatch):
+    def failing(self, body_only=False, bands=1):
+        yield b"\x1bP7;1;75q"
+        raise MemoryError("out of memory")
+
+    monkeypatch.setattr(sixel.converter.SixelConverter, "iter_encode", failing)
+    monkeypatch.setattr(daemon, "handle_error", lambda *args: None)
+    output = io.BytesIO()
+    SixelClient(daemon.path).request(_png(picture), output)
+    assert output.getvalue() == b"\x1bP7;1;75q\x1b\\"
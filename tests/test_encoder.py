@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import pytest
+
+import sixel.converter
+from sixel.converter import SixelConverter
+
+MODES = [
+    {"fast": True},
+    {"fast": False},
+    {"packed": True},
+    {"optimize": 1},
+    {"optimize": 2},
+    {"optimize": 3},
+]
+# The fast and size modes keep the column offsets of the original encoder,
+# so only the packed encoders paint exactly the quantized image; their round
+# trips are in test_packed.py and test_optimize.py
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_encoding_twice_is_identical(picture, mode):
+    converter = SixelConverter(picture, **mode)
+    data = b"".join(converter.iter_encode())
+    assert converter.tobytes() == data
+    assert converter.tobytes() == data
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_numpy_and_python_are_identical(picture, mode, monkeypatch):
+    pytest.importorskip("numpy")
+    data = SixelConverter(picture, **mode).tobytes()
+    monkeypatch.setattr(sixel.converter, "numpy", None)
+    assert SixelConverter(picture, **mode).tobytes() == data
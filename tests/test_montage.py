@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import pytest
+from PIL import Image
+
+from sixel.montage import montage, parse_grid
+
+
+def test_parse_grid():
+    assert parse_grid("4x3") == (4, 3)
+    assert parse_grid("5") == (5, None)
+    with pytest.raises(ValueError):
+        parse_grid("0x2")
+
+
+def test_fractional_sizes(picture):
+    # Sizes in cells times a cell width such as 9.5 pixels
+    sheet = montage([picture, picture, picture], 2, size=(190.0, 95.5),
+                    cell_size=(40.5, 30.25), jobs=1)
+    assert sheet.size == (190, 94)
+
+
+def test_layout_and_errors(tmp_path, picture):
+    broken = tmp_path / "broken.png"
+    broken.write_bytes(b"not an image")
+    sheet = montage([picture, str(broken), picture], 2, cell_size=(32, 32),
+                    gap=2, labels=True)
+    assert sheet.width == 2 * (32 + 2) + 2
+    assert [str(path) for path, error in sheet.info["errors"]] == [str(broken)]
+    # The first thumbnail is centered in its cell, the second cell is empty
+    assert sheet.getpixel((18, 18)) != (0, 0, 0)
+    assert sheet.getpixel((34 + 18, 18)) == (0, 0, 0)
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import pytest
+
+from sixel.converter import MAX_OPTIMIZE, SixelConverter
+
+from decoder import decode, expected
+
+LEVELS = range(1, MAX_OPTIMIZE + 1)
+
+
+@pytest.mark.parametrize("level", LEVELS)
+def test_round_trip(picture, level):
+    converter = SixelConverter(picture, optimize=level)
+    width, height, rows = decode(converter.tobytes())
+    assert (width, height) == picture.size
+    assert rows == expected(converter)
+
+
+@pytest.mark.parametrize("level", LEVELS)
+def test_round_trip_without_numpy(picture, level, without_numpy):
+    converter = SixelConverter(picture, optimize=level)
+    assert decode(converter.tobytes())[2] == expected(converter)
+
+
+def test_optimize_is_not_larger_than_packed(picture):
+    packed = len(SixelConverter(picture, packed=True).tobytes())
+    sizes = [len(SixelConverter(picture, optimize=level).tobytes())
+             for level in LEVELS]
+    assert sizes[0] < packed
+    assert sizes == sorted(sizes, reverse=True)
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from sixel.converter import SixelConverter
+
+from decoder import decode, expected
+
+
+def test_round_trip(picture):
+    converter = SixelConverter(picture, packed=True)
+    width, height, rows = decode(converter.tobytes())
+    assert (width, height) == picture.size
+    assert rows == expected(converter)
+
+
+def test_round_trip_without_numpy(picture, without_numpy):
+    converter = SixelConverter(picture, packed=True)
+    assert decode(converter.tobytes())[2] == expected(converter)
@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import pytest
+
+from sixel.converter import SixelConverter
+
+from decoder import decode
+
+
+@pytest.mark.parametrize("mode", [{"fast": False}, {"packed": True},
+                                  {"optimize": 1}, {"optimize": 3}])
+def test_parallel_paints_like_serial(tall_picture, mode):
+    serial = SixelConverter(tall_picture, **mode).tobytes()
+    parallel = SixelConverter(tall_picture, workers=2, **mode).tobytes()
+    assert decode(parallel) == decode(serial)
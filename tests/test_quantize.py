@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import pytest
+
+from sixel.converter import SixelConverter
+from sixel.quantize import _xterm256, fixed_palette
+
+
+@pytest.mark.parametrize("name, ncolor", [("xterm256", 16), ("websafe", 64),
+                                          ("xterm256", 256)])
+def test_fixed_palette_fits_the_registers(name, ncolor):
+    colors = fixed_palette(name, ncolor).getpalette()
+    assert len(colors) == 3 * min(ncolor, 256 if name == "xterm256" else 216)
+
+
+def test_fixed_palette_subset_keeps_exact_colors():
+    colors = fixed_palette("xterm256", 16).getpalette()
+    xterm = set(_xterm256())
+    assert all(tuple(colors[i:i + 3]) in xterm for i in range(0, 48, 3))
+
+
+def test_fixed_palette_with_few_registers(picture):
+    converter = SixelConverter(picture, ncolor=16, quantizer="xterm256")
+    assert len(converter.palette) <= 16 * 3
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import pytest
+
+from sixel.converter import SixelConverter
+from sixel.strips import SixelStripConverter
+
+from decoder import decode
+
+
+@pytest.mark.parametrize("quantizer", ["xterm256", "grayscale"])
+def test_strips_paint_like_whole_image(tall_picture, quantizer):
+    # Fixed palettes make both converters choose the same colors
+    whole = SixelConverter(tall_picture, packed=True, quantizer=quantizer)
+    strips = SixelStripConverter(tall_picture, quantizer=quantizer,
+                                 max_memory=1)
+    assert strips._strip_rows < tall_picture.height
+    assert decode(strips.tobytes()) == decode(whole.tobytes())
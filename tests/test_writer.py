@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import io
+import os
+import select
+import signal
+import subprocess
+import sys
+import time
+
+import pytest
+from PIL import Image
+
+import sixel.sixel
+from sixel import ChunkedWriter, ColorRegisters, SixelCanvas, SixelWriter
+
+
+class StallingOutput(io.BytesIO):
+    """Times out once like a stalled terminal after ``limit`` bytes."""
+
+    def __init__(self, limit):
+        super().__init__()
+        self.limit = limit
+
+    def write(self, data):
+        if self.limit is not None and self.tell() + len(data) > self.limit:
+            self.limit = None
+            raise TimeoutError("stalled")
+        return super().write(data)
+
+
+def test_abort_terminates_the_image(picture):
+    output = StallingOutput(200)
+    with pytest.raises(TimeoutError):
+        SixelWriter().draw(picture, output=output, stream=True)
+    assert output.getvalue().startswith(b"\x1bP")
+    assert output.getvalue().endswith(b"\x1b\\")
+
+
+def test_abort_forgets_shared_registers(picture):
+    writer = SixelWriter(registers=ColorRegisters(shared=True))
+    with pytest.raises(TimeoutError):
+        writer.draw(picture, output=StallingOutput(200), packed=True)
+    output = io.BytesIO()
+    writer.draw(picture, output=output, packed=True)
+    assert b";2;" in output.getvalue()
+
+
+def test_canvas_redraws_all_after_abort(picture):
+    canvas = SixelCanvas()
+    with pytest.raises(TimeoutError):
+        canvas.draw(picture, output=StallingOutput(200))
+    output = io.BytesIO()
+    canvas.draw(picture, output=output)
+    assert canvas.full_refreshes == 2
+
+
+def _stalled_pipe():
+    read_fd, write_fd = os.pipe()
+    os.set_blocking(write_fd, False)
+    try:
+        while True:
+            os.write(write_fd, b"x" * 65536)
+    except BlockingIOError:
+        pass
+    os.set_blocking(write_fd, True)
+    return read_fd, write_fd
+
+
+@pytest.mark.skipif(not hasattr(select, "poll"), reason="needs poll()")
+def test_abort_waits_briefly_after_a_timeout(picture, monkeypatch):
+    monkeypatch.setattr(sixel.sixel, "ABORT_TIMEOUT", 0.05)
+    read_fd, write_fd = _stalled_pipe()
+    try:
+        output = ChunkedWriter(write_fd, timeout=1)
+        start = time.monotonic()
+        with pytest.raises(TimeoutError):
+            SixelWriter().draw(picture, output=output)
+        assert time.monotonic() - start < 1.5
+        assert output.timeout == 1
+        output.close()
+        assert os.get_blocking(write_fd)
+    finally:
+        os.close(read_fd)
+        os.close(write_fd)
+
+
+@pytest.mark.skipif(not hasattr(select, "poll"), reason="needs poll()")
+def test_sigterm_restores_blocking_mode():
+    read_fd, write_fd = os.pipe()
+    code = ("import os, signal, sys\n"
+            "from sixel import ChunkedWriter\n"
+            "ChunkedWriter(%d)\n"
+            "os.kill(os.getpid(), signal.SIGTERM)\n" % write_fd)
+    try:
+        process = subprocess.run([sys.executable, "-c", code],
+                                 pass_fds=(write_fd,), timeout=30)
+        assert process.returncode == -signal.SIGTERM
+        assert os.get_blocking(write_fd)
+    finally:
+        os.close(read_fd)
+        os.close(write_fd)
+
+
+def test_draw_keeps_the_current_frame():
+    frames = [Image.new("RGB", (8, 8), color) for color in ("red", "blue")]
+    stream = io.BytesIO()
+    frames[0].save(stream, "GIF", save_all=True, append_images=frames[1:])
+    image = Image.open(stream)
+    image.seek(1)
+    output = io.BytesIO()
+    SixelWriter().draw(image, output=output, packed=True)
+    assert image.tell() == 1
+    assert b"#0;2;0;0;99" in output.getvalue()
+
+
+def test_draw_renders_a_figure_once(figure):
+    SixelWriter().draw(figure, output=io.BytesIO())
+    assert len(figure.threads) == 1